@@ -1,8 +1,10 @@
 from imarketmaker import MarketMakerInterface
 from inputtx import InputTx
-from typing import List, Tuple
+from typing import List, Tuple, Dict
 from outputtx import OutputTx
 from poolstatus import PairwiseTokenPoolStatus
+import numpy as np
+from math import sqrt
 
 class AMM(MarketMakerInterface):
     def __init__(self, pairwise_pools: List[Tuple[str, str]], pairwise_infos: List[Tuple[float, float, float]], 
@@ -31,16 +33,18 @@ class AMM(MarketMakerInterface):
         2. status of pool ater swap
         """
         in_type, in_val, out_type = tx.intype, tx.inval, tx.outtype
-        in_balance, out_balance, k = self.token_info[(in_type, out_type)]
+        in_balance, out_balance, k = self.pools[in_type][out_type]
         const = in_balance * out_balance
-        out_amt = const*(1/in_balance - (1/(in_balance + in_val)))
+        new_in = in_balance + in_val
+        # const*(1/in_balance - 1/(in_balance + in_val)), with one division
+        out_amt = out_balance * in_val / new_in
         
         output_tx, pool_stat = super().swap(tx, out_amt)
-        try:
-            output_tx.after_rate = in_val / \
-                    (const*(1/(in_balance + in_val) - (1/(in_balance + 2*in_val))))
-        except ZeroDivisionError:
-            pass
+        next_in = new_in + in_val
+        if next_in != 0:
+            denom = const * (1 / new_in - 1 / next_in)
+            if denom != 0:
+                output_tx.after_rate = in_val / denom
 
         return output_tx, pool_stat
     
@@ -56,10 +60,34 @@ class AMM(MarketMakerInterface):
         1. equilibrium balance for input token
         2. equilibrium balance for output token
         """
-        pool = (intype, outtype)
-        const = self.token_info[pool][1] * self.token_info[pool][0]
-        market_rate = self.prices[pool[1]] / self.prices[pool[0]]
-        new_out = (const / market_rate) ** 0.5
+        in_balance, out_balance, _ = self.pools[intype][outtype]
+        const = out_balance * in_balance
+        market_rate = self.market_rates[intype][outtype]
+        new_out = sqrt(const / market_rate)
 
         return const / new_out, new_out
-    
+
+    def getRates(self, pools: List[Tuple[str, str]], cache: Dict = None
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns statistics about moving many token pairs to an equilibrium
+
+        Parameters:
+        1. pools: token pools, in order of intype and outtype
+        2. cache: unused, as all pools are recomputed at once
+
+        Returns:
+        1. amounts of intype token to input to reach equilibrium
+        2. amounts of outtype token to remove to reach equilibrium
+        3. ratios of internal exchange rate to market rate
+        """
+        rows = [self.token_info.index[pool] for pool in pools]
+        in_balances, out_balances = self.token_info.array[rows, 0], self.token_info.array[rows, 1]
+        market_rates = np.array([self.market_rates[pool[0]][pool[1]] for pool in pools],
+            dtype=np.float64)
+
+        const = out_balances * in_balances
+        new_outs = np.sqrt(const / market_rates)
+        in_amts, out_amts = const / new_outs - in_balances, out_balances - new_outs
+
+        return in_amts, out_amts, self.compareRates(market_rates, in_amts, out_amts)
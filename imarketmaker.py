@@ -1,8 +1,8 @@
 from typing import List, Tuple, Dict
+import numpy as np
 from inputtx import InputTx
 from outputtx import OutputTx
 from poolstatus import PoolStatusInterface, PairwiseTokenPoolStatus, MultiTokenPoolStatus
-from copy import deepcopy
 
 class MarketMakerInterface():
     def __init__(self, pairwise_pools: List[Tuple[str, str]], pairwise_infos: List[Tuple[float, float, float]], 
@@ -21,7 +21,10 @@ class MarketMakerInterface():
         self.single_pools = single_pools
         self.single_infos = single_infos
         self.token_info = None
+        self.pools = None
         self.equilibriums = None
+        self.prices = None
+        self.market_rates = None
 
     def configure_simulation(self, reset_tx: str = "False", arb: str = "True",
     arb_actions: int = 1, multi_token: str = "True", k: float = -1, pairwise_monitors = None,
@@ -44,10 +47,11 @@ class MarketMakerInterface():
         if self.multi_token:
             self.token_info = MultiTokenPoolStatus({self.single_pools[i]: self.single_infos[i] \
                 for i in range(len(self.single_pools))})
-            self.equilibriums = deepcopy(self.token_info)
+            self.equilibriums = self.token_info.snapshot()
         else:
             self.token_info = PairwiseTokenPoolStatus(self.pairwise_pools, self.pairwise_infos)
-            self.equilibriums = deepcopy(self.token_info)
+            self.pools = self.token_info.pool_index()
+            self.equilibriums = self.token_info.snapshot()
 
         if k != -1:
             for v in self.token_info.values():
@@ -62,6 +66,21 @@ class MarketMakerInterface():
         removed from the pool
         """
         self.crash_type = crash_type
+        self.crash_type_set = frozenset(crash_type)
+
+    def set_prices(self, prices: Dict[str, float]):
+        """
+        Sets token prices and the market exchange rates between every pair of
+        tokens, which stay fixed for a whole batch of swaps
+
+        Parameters:
+        1. prices: maps tokens to prices
+        """
+        self.prices = prices
+        self.market_rates = {
+            intype: {outtype: out_price / in_price for outtype, out_price in prices.items()}
+            for intype, in_price in prices.items()
+        }
 
     def simulate_traffic(self,
                          traffic: List[List[InputTx]],
@@ -81,48 +100,92 @@ class MarketMakerInterface():
         3. initial status of pool
         4. final status of pool
         """
-        self.prices = external_price[0]
-        initial_copy = deepcopy(self.token_info)
+        self.set_prices(external_price[0])
+        initial_copy = self.token_info.snapshot()
 
         txs = []
         stats = []
 
-        if self.reset_tx:
-            token_info_copy = deepcopy(self.token_info)
-            equilibrium_copy = deepcopy(self.equilibriums)
+        arb, reset_tx = self.arb, self.reset_tx
+        set_prices, swap_batch, arbitrage = self.set_prices, self.swap_batch, self.arbitrage
+        restore, restore_equilibriums = self.token_info.restore, self.equilibriums.restore
+
+        pristine = None
+        if reset_tx:
+            pristine = self.token_info.snapshot()
+            pristine_equilibriums = self.equilibriums.snapshot()
 
         for j, batch in enumerate(traffic):
-            self.prices = external_price[j]
+            set_prices(external_price[j])
             batch_txs = []
             batch_stats = []
 
-            if self.reset_tx:
-                self.token_info = token_info_copy
-                self.equilibriums = equilibrium_copy
-                token_info_copy = deepcopy(self.token_info)
-                equilibrium_copy = deepcopy(self.equilibriums)
-
-            for tx in batch:
-                if tx.is_arb and self.arb:
-                    output_lst, stat_lst = self.arbitrage()
-                    for i in output_lst:
-                        batch_txs.append(i)
-                    for i in stat_lst:
-                        batch_stats.append(i)
+            # swaps between arbitrage actions are handed over together; without
+            # arbitrage the whole batch is one run
+            swap_run = [] if arb else batch
+            for tx in (batch if arb else ()):
+                if tx.is_arb:
+                    if swap_run:
+                        output_lst, stat_lst = swap_batch(swap_run, pristine)
+                        batch_txs.extend(output_lst)
+                        batch_stats.extend(stat_lst)
+                        swap_run = []
+
+                    output_lst, stat_lst = arbitrage()
+                    batch_txs.extend(output_lst)
+                    batch_stats.extend(stat_lst)
+
+                    if reset_tx:
+                        for output in output_lst:
+                            restore(pristine, output.in_type, output.out_type)
                 else:
-                    info, stat = self.swap(tx, None)
-                    batch_txs.append(info)
-                    batch_stats.append(stat)
+                    swap_run.append(tx)
+
+            if swap_run:
+                output_lst, stat_lst = swap_batch(swap_run, pristine)
+                batch_txs.extend(output_lst)
+                batch_stats.extend(stat_lst)
 
-                if self.reset_tx:
-                    self.token_info = token_info_copy
-                    token_info_copy = deepcopy(self.token_info)
+            # equilibriums are only reset between batches
+            if reset_tx:
+                for output in batch_txs:
+                    restore_equilibriums(pristine_equilibriums, output.in_type, output.out_type)
 
             txs.append(batch_txs)
             stats.append(batch_stats)
 
         return txs, stats, initial_copy, self.crash_type
     
+    def swap_batch(self, txs: List[InputTx], pristine: PoolStatusInterface = None
+    ) -> Tuple[List[OutputTx], List[PoolStatusInterface]]:
+        """
+        Initiates consecutive swaps which all happen at the same token prices
+
+        Parameters:
+        1. txs: transactions, in order of execution
+        2. pristine: if given, pool status to restore from after every swap
+
+        Returns:
+        1. output information associated with each swap
+        2. status of pool after each swap
+        """
+        outputs, statuses = [], []
+        swap, restore = self.swap, self.token_info.restore
+
+        if pristine == None:
+            for tx in txs:
+                output, status = swap(tx, None)
+                outputs.append(output)
+                statuses.append(status)
+        else:
+            for tx in txs:
+                output, status = swap(tx, None)
+                outputs.append(output)
+                statuses.append(status)
+                restore(pristine, output.in_type, output.out_type)
+
+        return outputs, statuses
+
     def swap(self, tx: InputTx, out_amt: float, execute: bool = True
     ) -> Tuple[OutputTx, PoolStatusInterface]:
         """
@@ -141,34 +204,37 @@ class MarketMakerInterface():
         if out_amt == None:
             raise NotImplementedError
         else:
+            intype, outtype, inval = tx.intype, tx.outtype, tx.inval
+            token_info = self.token_info
             if self.multi_token:
-                in0, out0 = self.token_info[tx.intype][0], self.token_info[tx.outtype][0]
+                in_info, out_info = token_info[intype], token_info[outtype]
+                in0, out0 = in_info[0], out_info[0]
                 
                 if execute:
-                    self.token_info[tx.intype][0] += tx.inval
-                    self.token_info[tx.outtype][0] -= out_amt
+                    in_info[0] = in0 + inval
+                    out_info[0] = out0 - out_amt
             else:
-                pool_info = self.token_info[(tx.intype, tx.outtype)]
+                pool_info = self.pools[intype][outtype]
                 in0, out0 = pool_info[0], pool_info[1]
 
                 if execute:
-                    pool_info[0] += tx.inval
-                    pool_info[1] -= out_amt
+                    pool_info[0] = in0 + inval
+                    pool_info[1] = out0 - out_amt
 
-                    reverse_pool = self.token_info[(tx.outtype, tx.intype)]
+                    reverse_pool = self.pools[outtype][intype]
                     reverse_pool[0] -= out_amt
-                    reverse_pool[1] += tx.inval
+                    reverse_pool[1] += inval
 
             return OutputTx(
-                tx.intype,
-                tx.outtype,
+                intype,
+                outtype,
                 in0,
                 out0,
-                in0 + tx.inval,
+                in0 + inval,
                 out0 - out_amt,
-                self.prices[tx.outtype] / self.prices[tx.intype],
+                self.market_rates[intype][outtype],
                 1
-            ), deepcopy(self.token_info)
+            ), token_info.snapshot()
     
     def calculate_equilibriums(self, intype: str, outtype: str) -> Tuple[float, float, float]:
         """
@@ -198,46 +264,128 @@ class MarketMakerInterface():
         2. list of pool statuses after each arbitrage swap
         """
         outputtx_lst, poolstatus_lst = [], []
+        pools = self.arbitragePools()
         info = [("str", "str"), {"rate": -1}]
+        if not pools:
+            return outputtx_lst, poolstatus_lst
 
+        # equilibriums of pools untouched by earlier arbitrage swaps are reused
+        cache = {}
+        getRates, swap = self.getRates, self.swap
         for i in range(self.arb_actions):
-            if self.multi_token:
-                tokens = list(self.token_info.keys())
-                for c, tok1 in enumerate(tokens):
-                    for tok2 in tokens[c+1:]:
-                        pool = (tok1, tok2)
-                        reverse_pool = (tok2, tok1)
-                        if not tok2 in self.crash_type:
-                            rate_dict = self.getRate(pool)
-                            if rate_dict["rate"] > info[1]["rate"] and \
-                                rate_dict["in_amt"] > lim:
-                                info[0] = pool
-                                info[1] = rate_dict
-                        if not tok1 in self.crash_type:
-                            rate_dict = self.getRate(reverse_pool)
-                            if rate_dict["rate"] > info[1]["rate"] and \
-                                rate_dict["in_amt"] > lim:
-                                info[0] = reverse_pool
-                                info[1] = rate_dict
-            else:
-                for p in self.token_info.keys():
-                    if not p[1] in self.crash_type:
-                        rate_dict = self.getRate(p)
-                        if rate_dict["rate"] > info[1]["rate"] and \
-                            rate_dict["in_amt"] > lim:
-                            info[0] = p
-                            info[1] = rate_dict
+            in_amts, out_amts, rates = getRates(pools, cache)
+            candidates = np.where((rates > info[1]["rate"]) & (in_amts > lim), rates, -np.inf)
+            best = int(np.argmax(candidates))
+            if candidates[best] != -np.inf:
+                info[0] = pools[best]
+                info[1] = {
+                    "in_amt": float(in_amts[best]),
+                    "out_amt": float(out_amts[best]),
+                    "rate": float(rates[best])
+                }
 
             if info[1]["rate"] > 1 and info[1]["in_amt"] > 0:
-                output, token_info = self.swap(InputTx(info[0][0], info[0][1], \
+                output, token_info = swap(InputTx(info[0][0], info[0][1], \
                     info[1]["in_amt"]), info[1]["out_amt"])
                 outputtx_lst.append(output)
                 poolstatus_lst.append(token_info)              
+                self.invalidateRates(cache, info[0])
             else:
                 break
         
         return outputtx_lst, poolstatus_lst         
     
+    def arbitragePools(self) -> List[Tuple[str, str]]:
+        """
+        Lists the token pairs arbitrage may swap between; the output token type
+        is never a crashing token
+
+        Returns:
+        1. token pools, in order of intype and outtype
+        """
+        pools = []
+        crash_type = self.crash_type_set
+        if self.multi_token:
+            tokens = list(self.token_info.keys())
+            for c, tok1 in enumerate(tokens):
+                for tok2 in tokens[c+1:]:
+                    if not tok2 in crash_type:
+                        pools.append((tok1, tok2))
+                    if not tok1 in crash_type:
+                        pools.append((tok2, tok1))
+        else:
+            for p in self.token_info.keys():
+                if not p[1] in crash_type:
+                    pools.append(p)
+
+        return pools
+
+    def invalidateRates(self, cache: Dict[Tuple[str, str], Dict[str, float]],
+    pool: Tuple[str, str]):
+        """
+        Drops the cached statistics that a swap between a token pair made stale
+
+        Parameters:
+        1. cache: statistics from getRate for each token pool
+        2. pool: token pool that was swapped, in order of intype and outtype
+        """
+        if self.multi_token:
+            for key in [key for key in cache if key[0] in pool or key[1] in pool]:
+                del cache[key]
+        else:
+            cache.pop(pool, None)
+            cache.pop((pool[1], pool[0]), None)
+
+    def getRates(self, pools: List[Tuple[str, str]],
+    cache: Dict[Tuple[str, str], Dict[str, float]] = None
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns statistics about moving many token pairs to an equilibrium;
+        market makers with a closed form equilibrium can compute these all at once
+
+        Parameters:
+        1. pools: token pools, in order of intype and outtype
+        2. cache: if given, statistics from getRate for each token pool, which are
+        reused and filled in
+
+        Returns:
+        1. amounts of intype token to input to reach equilibrium
+        2. amounts of outtype token to remove to reach equilibrium
+        3. ratios of internal exchange rate to market rate
+        """
+        if cache == None:
+            rate_dicts = [self.getRate(pool) for pool in pools]
+        else:
+            rate_dicts = []
+            for pool in pools:
+                rate_dict = cache.get(pool)
+                if rate_dict == None:
+                    rate_dict = cache[pool] = self.getRate(pool)
+                rate_dicts.append(rate_dict)
+
+        return np.array([i["in_amt"] for i in rate_dicts], dtype=np.float64), \
+            np.array([i["out_amt"] for i in rate_dicts], dtype=np.float64), \
+            np.array([i["rate"] for i in rate_dicts], dtype=np.float64)
+
+    def compareRates(self, market_rates: np.ndarray, in_amts: np.ndarray, out_amts: np.ndarray
+    ) -> np.ndarray:
+        """
+        Vectorized version of the rate computed in getRate
+
+        Parameters:
+        1. market_rates: market exchange rates
+        2. in_amts: amounts of intype token to input to reach equilibrium
+        3. out_amts: amounts of outtype token to remove to reach equilibrium
+
+        Returns:
+        1. ratios of internal exchange rate to market rate
+        """
+        internal_rates = np.ones_like(in_amts)
+        np.divide(in_amts, out_amts, out=internal_rates, where=out_amts != 0)
+        internal_rates[internal_rates == 0] = 1
+
+        return market_rates / internal_rates
+
     def getRate(self, pool: Tuple[str, str]) -> Dict[str, float]:
         """
         Returns statistics about moving the intype and outtype to an equilibrium
@@ -254,19 +402,16 @@ class MarketMakerInterface():
         }
         """
         in_e, out_e = self.calculate_equilibriums(pool[0], pool[1])
-        market_rate = self.prices[pool[1]] / self.prices[pool[0]]
+        market_rate = self.market_rates[pool[0]][pool[1]]
 
         if self.multi_token:
             in_amt, out_amt = \
                 in_e - self.token_info[pool[0]][0], self.token_info[pool[1]][0] - out_e
         else:
-            in_amt, out_amt = \
-                in_e - self.token_info[pool][0], self.token_info[pool][1] - out_e
+            pool_info = self.pools[pool[0]][pool[1]]
+            in_amt, out_amt = in_e - pool_info[0], pool_info[1] - out_e
         
-        try:
-            internal_rate = in_amt / out_amt
-        except:
-            internal_rate = 1
+        internal_rate = in_amt / out_amt if out_amt != 0 else 1
         if internal_rate == 0:
             internal_rate = 1
 
@@ -4,6 +4,7 @@ from collections import OrderedDict
 import random
 import os
 import pandas as pd
+import numpy as np
 from copy import deepcopy
 
 class Initializer():
@@ -78,81 +79,32 @@ class Initializer():
 
         self.traffic_info = token_infos["traffic_gen"]
         self.price_gen_info = token_infos["price_gen"]
-        
-        # price_info = {i : self.price_gen_info[i]["start"] for i in self.price_gen_info}
         self.crash_types = [i for i in self.price_gen_info if \
             ("mean" in self.price_gen_info[i] and self.price_gen_info[i]["mean"] < 0)]
-        # tokens = list(price_info.keys())
-        # base = tokens[0]
-        # num_tokens = len(price_info)
-        # respective_prices = {}
-        # self.constant = self.constant ** len(self.price_gen_info)
-        
-        # for i in price_info:
-        #     if i != base:
-        #         price = price_info[i] / price_info[base]
-        #         respective_prices[i] = price
-        #         self.constant *= price
-        # self.constant = self.constant ** (1/num_tokens)
 
-        # for i in respective_prices:
-        #     price_info[i] = self.constant / respective_prices[i]
-        # price_info[base] = self.constant
-
-        # num_pools = num_tokens * (num_tokens - 1) / 2
-        # self.single_pools = list(price_info.keys())
-        # self.single_infos = [[i] for i in price_info.values()]
-        # token_k = {}
-        
-        # for i, tok1 in enumerate(tokens):
-        #     for tok2 in tokens[i+1:]:
-        #         pool = [tok1, tok2]
-        #         reverse_pool = [tok2, tok1]
-        #         self.pairwise_pools.append(pool)
-        #         self.pairwise_pools.append(reverse_pool)
-                
-        #         pool_balances = [price_info[tok1] / num_pools, price_info[tok2] / num_pools]
-        #         reverse_pool_balances = [pool_balances[1], pool_balances[0]]
-        #         self.pairwise_infos.append(pool_balances)
-        #         self.pairwise_infos.append(reverse_pool_balances)
+        self.single_pools = list(self.token_to_cap.keys())
+        token_k = [random.randrange(1, 1000) / 1000 for _ in self.single_pools]
+        caps = np.array(list(self.token_to_cap.values()))
+        start_prices = np.array(list(self.token_start_price.values()))
+        ks = np.array(token_k)
 
-        #         token_k[tok1] = random.randrange(1, 1000) / 1000
-        #         token_k[tok2] = random.randrange(1, 1000) / 1000
-        
-        # for i, pool in enumerate(self.pairwise_pools):
-        #     self.pairwise_infos[i].append((token_k[pool[0]] + token_k[pool[1]]) / 2)
-        
-        # for i, tok in enumerate(self.single_pools):
-        #     self.single_infos[i].append(token_k[tok])
+        # every pair of tokens gets a pool (and its reverse) holding a share of
+        # both tokens' market maker caps
+        pool_caps = np.outer(caps, caps) / sum(self.token_to_cap.values())
+        firsts, seconds = np.triu_indices(len(self.single_pools), k=1)
+        first_balances = (pool_caps[firsts, seconds] / start_prices[firsts]).tolist()
+        second_balances = (pool_caps[firsts, seconds] / start_prices[seconds]).tolist()
+        pool_ks = ((ks[firsts] + ks[seconds]) / 2).tolist()
 
-        
-        
-        
-        self.single_pools = list(self.token_to_cap.keys())
-        self.single_infos = list(cap / price for cap, price in zip(self.token_to_cap.values(), self.token_start_price.values()))
-        total_mm_cap = sum(self.token_to_cap.values())
-        token_k = {}
-        for i, tok1 in enumerate(self.single_pools):
-            token_k[tok1] = random.randrange(1, 1000) / 1000
-            for tok2 in self.single_pools[i + 1:]:
-                pool = [tok1, tok2]
-                reverse_pool = [tok2, tok1]
-                self.pairwise_pools.append(pool)
-                self.pairwise_pools.append(reverse_pool)
+        for i, j, first_balance, second_balance, k in zip(firsts.tolist(), seconds.tolist(),
+            first_balances, second_balances, pool_ks):
+            tok1, tok2 = self.single_pools[i], self.single_pools[j]
+            self.pairwise_pools.append([tok1, tok2])
+            self.pairwise_pools.append([tok2, tok1])
+            self.pairwise_infos.append([first_balance, second_balance, k])
+            self.pairwise_infos.append([second_balance, first_balance, k])
 
-                tok1_mm_cap = self.token_to_cap[tok1]
-                tok2_mm_cap = self.token_to_cap[tok2]
-                pool_cap = tok1_mm_cap * tok2_mm_cap / total_mm_cap
-                pool_balances = [pool_cap / self.token_start_price[tok1], pool_cap / self.token_start_price[tok2]]
-                reverse_pool_balances = [pool_balances[1], pool_balances[0]]
-                self.pairwise_infos.append(pool_balances)
-                self.pairwise_infos.append(reverse_pool_balances)
-        
-        for i, pool in enumerate(self.pairwise_pools):
-            self.pairwise_infos[i].append((token_k[pool[0]] + token_k[pool[1]]) / 2)
-        
-        for i, tok in enumerate(self.single_pools):
-            self.single_infos[i] = (self.single_infos[i], token_k[tok])
+        self.single_infos = list(zip((caps / start_prices).tolist(), token_k))
 
     def get_stats(self
     ) -> Tuple[List[Tuple[str, str]], List[Tuple[float, float, float]],
@@ -172,6 +124,5 @@ class Initializer():
         7. token types that are crashing
         8. maximum token market cap
         """
-        import pdb; pdb.set_trace()
         return self.pairwise_pools, self.pairwise_infos, self.single_pools, self.single_infos, \
         self.traffic_info, self.price_gen_info, self.crash_types, self.cap_limit
\ No newline at end of file
@@ -1,4 +1,6 @@
 class InputTx:
+    __slots__ = ("intype", "outtype", "inval", "is_arb")
+
     def __init__(self, intype : str, outtype : str, inval : float, is_arb : bool = False):
         """
         Represents one transaction to in traffic
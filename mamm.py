@@ -1,8 +1,10 @@
 from imarketmaker import MarketMakerInterface
 from inputtx import InputTx
-from typing import List, Tuple
+from typing import List, Tuple, Dict
 from outputtx import OutputTx
 from poolstatus import MultiTokenPoolStatus
+import numpy as np
+from math import sqrt
 
 class MAMM(MarketMakerInterface):
     def __init__(self, pairwise_pools: List[Tuple[str, str]], pairwise_infos: List[Tuple[float, float, float]], 
@@ -18,6 +20,31 @@ class MAMM(MarketMakerInterface):
         """
         super().__init__(pairwise_pools, pairwise_infos, single_pools, single_infos)
 
+    def __quote(self, in_balance: float, out_balance: float, in_val: float) -> Tuple[float, float]:
+        """
+        Prices a swap against the current balances of its 2 token types
+
+        Parameters:
+        1. in_balance: input token balance before the swap
+        2. out_balance: output token balance before the swap
+        3. in_val: amount of input token inserted
+
+        Returns:
+        1. amount of output token removed
+        2. exchange rate the same swap would get after this one, or 1 if undefined
+        """
+        const = in_balance * out_balance
+        new_in = in_balance + in_val
+        # const*(1/in_balance - 1/(in_balance + in_val)), with one division
+        out_amt = out_balance * in_val / new_in
+
+        # in_val / (const*(1/new_in - 1/(new_in + in_val))), with in_val cancelled
+        after_rate = 1
+        if in_val != 0 and const != 0:
+            after_rate = new_in * (new_in + in_val) / const
+
+        return out_amt, after_rate
+
     def swap(self, tx: InputTx, out_amt: float = None) -> Tuple[OutputTx, MultiTokenPoolStatus]:
         """
         Initiate a swap specified by tx
@@ -30,20 +57,51 @@ class MAMM(MarketMakerInterface):
         1. output information associated with swap (after_rate is incorrect)
         2. status of pool ater swap
         """
-        in_type, in_val, out_type = tx.intype, tx.inval, tx.outtype
-        in_balance, out_balance = self.token_info[in_type][0], self.token_info[out_type][0]
-        const = in_balance * out_balance
-        out_amt = const*(1/in_balance - (1/(in_balance + in_val)))
+        out_amt, after_rate = self.__quote(self.token_info[tx.intype][0],
+            self.token_info[tx.outtype][0], tx.inval)
 
         output_tx, pool_stat = super().swap(tx, out_amt)
-        try:
-            output_tx.after_rate = in_val / \
-                    (const*(1/(in_balance + in_val) - (1/(in_balance + 2*in_val))))
-        except ZeroDivisionError:
-            pass
+        output_tx.after_rate = after_rate
         
         return output_tx, pool_stat
     
+    def swap_batch(self, txs: List[InputTx], pristine: MultiTokenPoolStatus = None
+    ) -> Tuple[List[OutputTx], List[MultiTokenPoolStatus]]:
+        """
+        Initiates consecutive swaps which all happen at the same token prices; same
+        as calling swap for each transaction, without the per swap method calls
+
+        Parameters:
+        1. txs: transactions, in order of execution
+        2. pristine: if given, pool status to restore from after every swap
+
+        Returns:
+        1. output information associated with each swap
+        2. status of pool after each swap
+        """
+        outputs, statuses = [], []
+        token_info, market_rates, quote = self.token_info, self.market_rates, self.__quote
+        snapshot, restore = token_info.snapshot, token_info.restore
+
+        # each swap sees the balances left by the one before, so this stays a loop
+        for tx in txs:
+            in_type, in_val, out_type = tx.intype, tx.inval, tx.outtype
+            in_info, out_info = token_info[in_type], token_info[out_type]
+            in_balance, out_balance = in_info[0], out_info[0]
+            out_amt, after_rate = quote(in_balance, out_balance, in_val)
+            # same bookkeeping as MarketMakerInterface.swap for a multi token pool
+            new_in, new_out = in_balance + in_val, out_balance - out_amt
+            in_info[0], out_info[0] = new_in, new_out
+
+            outputs.append(OutputTx(in_type, out_type, in_balance, out_balance, new_in, new_out,
+                market_rates[in_type][out_type], after_rate))
+            statuses.append(snapshot())
+
+            if pristine != None:
+                restore(pristine, in_type, out_type)
+
+        return outputs, statuses
+
     def calculate_equilibriums(self, intype: str, outtype: str) -> Tuple[float, float]:
         """
         Calculates and returns equilibrium balances
@@ -57,7 +115,33 @@ class MAMM(MarketMakerInterface):
         2. equilibrium balance for output token
         """
         const = self.token_info[intype][0] * self.token_info[outtype][0]
-        market_rate = self.prices[outtype] / self.prices[intype]
-        new_out = (const / market_rate) ** 0.5
+        market_rate = self.market_rates[intype][outtype]
+        new_out = sqrt(const / market_rate)
+
+        return const / new_out, new_out
+
+    def getRates(self, pools: List[Tuple[str, str]], cache: Dict = None
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns statistics about moving many token pairs to an equilibrium
+
+        Parameters:
+        1. pools: token pools, in order of intype and outtype
+        2. cache: unused, as all pools are recomputed at once
+
+        Returns:
+        1. amounts of intype token to input to reach equilibrium
+        2. amounts of outtype token to remove to reach equilibrium
+        3. ratios of internal exchange rate to market rate
+        """
+        index, balances = self.token_info.index, self.token_info.array[:, 0]
+        in_balances = balances[[index[pool[0]] for pool in pools]]
+        out_balances = balances[[index[pool[1]] for pool in pools]]
+        market_rates = np.array([self.market_rates[pool[0]][pool[1]] for pool in pools],
+            dtype=np.float64)
+
+        const = in_balances * out_balances
+        new_outs = np.sqrt(const / market_rates)
+        in_amts, out_amts = const / new_outs - in_balances, out_balances - new_outs
 
-        return const / new_out, new_out
\ No newline at end of file
+        return in_amts, out_amts, self.compareRates(market_rates, in_amts, out_amts)
\ No newline at end of file
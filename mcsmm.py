@@ -39,13 +39,13 @@ class MCSMM(MarketMakerInterface):
         1. output information associated with swap (after_rate is incorrect)
         2. status of pool ater swap
         """
-        p = self.prices[tx.outtype] / self.prices[tx.intype]
+        p = self.market_rates[tx.intype][tx.outtype]
         if out_amt == None:
-            if (tx.inval / p > self.token_info[tx.outtype][0]):
+            out_amt = tx.inval / p
+            # swaps that would drain more than the pool holds do not happen
+            if out_amt > self.token_info[tx.outtype][0]:
                 out_amt = 0
                 tx.inval = 0
-            else:
-                out_amt = tx.inval / p
 
         output_tx, pool_stat = super().swap(tx, out_amt)
         output_tx.after_rate = p
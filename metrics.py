@@ -1,103 +1,128 @@
 import numpy as np
-import statistics
-from typing import List, Tuple, Dict
+from typing import List, Tuple, Dict, Union
+from operator import attrgetter
 from outputtx import OutputTx
 from poolstatus import PoolStatusInterface
 
 OUTLIER_PERC = 0.0005
 
-def remove_outliers(data: List[Tuple[float, float]], outlier_percent: float
-) -> List[Tuple[float, float]]:
+def __measurements(data: Union[List[Tuple[float, float]], np.ndarray]) -> np.ndarray:
     """
-    Finds and removes outlier measurements
+    Gathers the measured values out of data
 
     Parameters:
-    1. data: input data
-    2. outlier_percent: percent of measurements that should be outliers
+    1. data: data, as a list or as an array with one row per measurement
 
     Returns:
-    1. data with outlier measurements removed
+    1. second entry of every row
     """
-    if len(data) > 2:
-        data = sorted(data, key = lambda x: x[1])
-        sorted_data = [i[1] for i in data]
-        med, _ = find_median(sorted_data)
-        data = sorted(data, key = lambda x: abs(x[1]-med), reverse=True)
-    return data[int(len(data) * outlier_percent):]
+    if isinstance(data, np.ndarray):
+        return data[:, 1]
 
-def find_median(data: List[float]) -> Tuple[float, List[int]]:
+    return np.array([i[1] for i in data], dtype=np.float64)
+
+def remove_outliers(data: Union[List[Tuple[float, float]], np.ndarray], outlier_percent: float
+) -> Union[List[Tuple[float, float]], np.ndarray]:
     """
-    Computes the indice(s) of or surrounding the median and returns the median
+    Finds and removes outlier measurements, the ones furthest from the median
 
     Parameters:
-    1. data: sorted list of values
+    1. data: input data, as a list or as an array with one row per measurement
+    2. outlier_percent: percent of measurements that should be outliers
 
     Returns:
-    1. median value
-    2. indice(s) surrounding the median in the input
+    1. data with outlier measurements removed, in input order and of the input type
+    """
+    outliers = int(len(data) * outlier_percent)
+    if len(data) <= 2 or outliers == 0:
+        return data[outliers:] if isinstance(data, np.ndarray) else list(data[outliers:])
+
+    values = __measurements(data)
+    deviations = np.abs(values - np.median(values))
+    threshold = np.partition(deviations, len(data) - outliers)[len(data) - outliers]
+    keep = deviations < threshold
+
+    # among measurements as far out as the threshold, smaller values and then
+    # earlier ones are removed first
+    ties = np.flatnonzero(deviations == threshold)
+    ties = ties[np.lexsort((ties, values[ties]))]
+    keep[ties[outliers - np.count_nonzero(deviations > threshold):]] = True
+
+    if isinstance(data, np.ndarray):
+        return data[keep]
+
+    return [i for i, kept in zip(data, keep.tolist()) if kept]
+
+def __sorted_median(values: np.ndarray) -> float:
     """
-    indices = []
-    list_size = len(data)
+    Finds the median of values that are already sorted, without partitioning
+    them again
 
-    if list_size % 2 == 0:
-        indices.append(int(list_size / 2) - 1)
-        indices.append(int(list_size / 2))
-        median = (data[indices[0]] + data[indices[1]]) / 2
-    else:
-        indices.append(int(list_size / 2))
-        median = data[indices[0]]
+    Parameters:
+    1. values: sorted values
 
-    return median, indices
+    Returns:
+    1. median value
+    """
+    return float((values[(len(values) - 1) // 2] + values[len(values) // 2]) / 2)
 
-def get_stats(data: List[float]) -> Dict[str, float]:
+def get_stats(data: Union[List[Tuple[float, float]], np.ndarray]) -> Dict[str, float]:
     """
     Computes and prints statistics given data
 
     Parameters:
-    1. data: data
+    1. data: data, as a list or as an array with one row per measurement
 
     Returns:
     1. statistics on Data
     """
     stat_dict = {}
     if len(data) > 2:
-        data = sorted(data, key = lambda x: x[1])
-        sorted_data = [i[1] for i in data]
-        med, median_indices = find_median(sorted_data)
-        q1, _ = find_median(sorted_data[:median_indices[0]])
-        q3, _ = find_median(sorted_data[median_indices[-1] + 1:])
-
-        stat_dict["avg"], stat_dict["med"] = sum(sorted_data) / len(sorted_data), med
-        stat_dict["quart_1"],  stat_dict["quart_3"] = q1, q3
-        stat_dict["min"], stat_dict["max"] = sorted_data[0], sorted_data[-1]
-        stat_dict["stdv"] = np.std(sorted_data)
+        values = np.sort(__measurements(data))
+        # quartiles are the medians of the values below and above the median value(s)
+        lower, upper = values[:(len(values) - 1) // 2], values[len(values) // 2 + 1:]
+
+        stat_dict["avg"], stat_dict["med"] = float(values.mean()), __sorted_median(values)
+        stat_dict["quart_1"],  stat_dict["quart_3"] = __sorted_median(lower), __sorted_median(upper)
+        stat_dict["min"], stat_dict["max"] = float(values[0]), float(values[-1])
+        stat_dict["stdv"] = values.std()
         stat_dict["counts"] = len(data)
 
     return stat_dict
 
-def __match_monitor(output: OutputTx, monitors: set[str]) -> str:
+def __pool_name(tok1: str, tok2: str) -> str:
+    """
+    Names the pool of a token pair the way pools are given as monitors
+
+    Parameters:
+    1. tok1: first token type
+    2. tok2: second token type
+
+    Returns:
+    1. pool name, i.e "BTC, ETH", with the token types in sorted order
+    """
+    if tok1 <= tok2:
+        return tok1 + ", " + tok2
+
+    return tok2 + ", " + tok1
+
+def __match_monitor(pair: Tuple[str, str], monitors: set[str], has_pools: bool) -> str:
     """
-    Returns 'True' if the OutputTx should be monitored
+    Returns 'True' if swaps between a token pair should be monitored
 
     Parameters:
-    1. output: OutputTx to gauge
+    1. pair: input and output token type of the swaps
     2. monitors: tokens or pools to monitor
+    3. has_pools: whether any monitor is a pool, i.e "BTC, ETH"
 
     Returns
-    1. pool or token if output should be monitored
+    1. pool or token if swaps should be monitored
     """
-    for test in monitors:
-        break
-    tok1, tok2 = output.in_type, output.out_type
-    if "," in test:
-        if tok1 <= tok2:
-            val = tok1 + ", " + tok2
-            if val in monitors:
-                return val
-        else:
-            val = tok2 + ", " + tok1
-            if val in monitors:
-                return val
+    tok1, tok2 = pair
+    if has_pools:
+        val = __pool_name(tok1, tok2)
+        if val in monitors:
+            return val
     
     if tok1 in monitors:
         return tok1
@@ -106,9 +131,162 @@ def __match_monitor(output: OutputTx, monitors: set[str]) -> str:
 
     return None
 
+def __outputs_to_arrays(output: List[List[OutputTx]], crash_types: List[str]
+) -> Tuple[Dict[str, np.ndarray], List[Tuple[str, str]], np.ndarray, np.ndarray]:
+    """
+    Gathers swap metrics into one array per OutputTx field
+
+    Parameters:
+    1. output: swap metrics
+    2. crash_types: what token types crashed in price
+
+    Returns:
+    1. arrays of each numeric OutputTx field, in order of execution
+    2. distinct (input token, output token) pairs swapped
+    3. index into the distinct pairs for each swap
+    4. whether the input token type of each swap crashed in price
+    """
+    infos = [info for batch in output for info in batch]
+    pairs = {}
+    codes = np.array([pairs.setdefault(pair, len(pairs)) \
+        for pair in map(attrgetter("in_type", "out_type"), infos)], dtype=np.intp)
+    values = np.array(list(map(attrgetter("inpool_init_val", "inpool_after_val",
+        "outpool_init_val", "outpool_after_val", "market_rate", "after_rate"), infos)),
+        dtype=np.float64).reshape(len(infos), 6)
+
+    columns = {
+        "inpool_init_val": values[:, 0],
+        "inpool_after_val": values[:, 1],
+        "outpool_init_val": values[:, 2],
+        "outpool_after_val": values[:, 3],
+        "market_rate": values[:, 4],
+        "after_rate": values[:, 5]
+    }
+    pairs = list(pairs)
+    crash_set = frozenset(crash_types)
+    crashed = np.array([pair[0] in crash_set for pair in pairs], dtype=bool)[codes]
+
+    return columns, pairs, codes, crashed
+
+def __split_results(drained: np.ndarray, ratios: np.ndarray, keep: np.ndarray, pos: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Pairs proportion of output token balance removed with absolute ratios
+
+    Parameters:
+    1. drained: proportion of output token balance removed by each swap
+    2. ratios: ratio measured for each swap
+    3. keep: which swaps to report
+    4. pos: which swaps belong to the first group
+
+    Returns:
+    1. [drained, ratio] for each kept swap in the first group
+    2. [drained, ratio] for each kept swap in the second group
+    """
+    results = np.column_stack((drained, np.abs(ratios)))
+
+    return results[keep & pos], results[keep & ~pos]
+
+def __monitor_results(pairs: List[Tuple[str, str]], codes: np.ndarray, drained: np.ndarray,
+ratios: np.ndarray, keep: np.ndarray, pos: np.ndarray, monitors: set[str]) -> Dict:
+    """
+    Splits the results of swaps on monitored tokens or pools
+
+    Parameters:
+    1. pairs: distinct (input token, output token) pairs swapped
+    2. codes: index into the distinct pairs for each swap
+    3. drained: proportion of output token balance removed by each swap
+    4. ratios: ratio measured for each swap
+    5. keep: which swaps are candidates for monitoring
+    6. pos: which swaps belong to the first group
+    7. monitors: tokens or pools to monitor
+
+    Returns:
+    1. for each monitor, [drained, ratio] for swaps in the first and second group
+    """
+    monitor_results = {i : [[],[],[],[]] for i in monitors}
+    has_pools = any("," in monitor for monitor in monitors)
+    names = list(monitor_results)
+    monitor_ids = {monitor: i for i, monitor in enumerate(names)}
+
+    # index of the monitor each token pair is reported under, or -1
+    pair_monitors = np.full(len(pairs), -1, dtype=np.int32)
+    for code in np.unique(codes[keep]).tolist():
+        monitor = __match_monitor(pairs[code], monitors, has_pools)
+        if monitor != None:
+            pair_monitors[code] = monitor_ids[monitor]
+
+    swap_monitors = pair_monitors[codes]
+    for monitor in np.unique(swap_monitors[keep]).tolist():
+        if monitor != -1:
+            results = monitor_results[names[monitor]]
+            results[0], results[1] = \
+                __split_results(drained, ratios, keep & (swap_monitors == monitor), pos)
+
+    return monitor_results
+
+def __swap_rates(columns: Dict[str, np.ndarray]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Computes the rate each swap executed at and how much of the output token
+    balance it removed
+
+    Parameters:
+    1. columns: arrays of each numeric OutputTx field
+
+    Returns:
+    1. amount of input token paid per output token for each swap
+    2. proportion of output token balance removed by each swap
+    3. whether each swap's rate and proportion were computed without dividing by zero
+    """
+    in_init, in_after = columns["inpool_init_val"], columns["inpool_after_val"]
+    out_init, out_after = columns["outpool_init_val"], columns["outpool_after_val"]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rate = (in_after - in_init) / (out_init - out_after)
+        drained = 1 - out_after / out_init
+
+    return rate, drained, (out_init != out_after) & (out_init != 0)
+
+def __summarize(pos_results: np.ndarray, neg_results: np.ndarray, monitor_results: Dict
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray,
+    Dict[str, float], Dict[str, float], Dict[str, float], Dict[str, float], Dict]:
+    """
+    Removes outliers from and computes statistics on per swap results; results
+    are handed back as arrays with one row per swap
+
+    Parameters:
+    1. pos_results: results in the first group, one row per swap
+    2. neg_results: results in the second group, one row per swap
+    3. monitor_results: results in each group for tokens or pools to be monitored
+
+    Returns:
+    1. results in the first group
+    2. results in the second group
+    3. results in the first group, outliers removed
+    4. results in the second group, outliers removed
+    5. statistics of the first group
+    6. statistics of the second group
+    7. statistics of the first group, outliers removed
+    8. statistics of the second group, outliers removed
+    9. statistics and results for tokens or pools to be monitored
+    """
+    proc_pos = remove_outliers(pos_results, OUTLIER_PERC)
+    proc_neg = remove_outliers(neg_results, OUTLIER_PERC)
+
+    for v in monitor_results.values():
+        pos, neg = v[0], v[1]
+        v[2], v[3] = remove_outliers(pos, OUTLIER_PERC), remove_outliers(neg, OUTLIER_PERC)
+        v.append(get_stats(pos))
+        v.append(get_stats(neg))
+        v.append(get_stats(v[2]))
+        v.append(get_stats(v[3]))
+
+    return pos_results, neg_results, proc_pos, proc_neg, \
+    get_stats(pos_results), get_stats(neg_results), get_stats(proc_pos), get_stats(proc_neg), \
+    monitor_results
+
 def price_impact(output: List[List[OutputTx]], crash_types: List[str], monitors: set[str]
-) -> Tuple[List[Tuple[float, float]], List[Tuple[float, float]],
-    List[Tuple[float, float]], List[Tuple[float, float]], 
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray,
     Dict[str, float], Dict[str, float], Dict[str, float], Dict[str, float], Dict]:
     """
     Measures price impact for transaction pairs before and after transactions' 
@@ -131,53 +309,24 @@ def price_impact(output: List[List[OutputTx]], crash_types: List[str], monitors:
     8. statistics of swaps when rate ratios <= 1, outliers removed
     9. statistics and rate ratios for tokens or pools to be monitored
     """
-    pos_results = []
-    neg_results = []
-    monitor_results = {i : [[],[],[],[]] for i in monitors}
-    
-    for lst in output:
-        for info in lst:
-            try: 
-                rate = (info.inpool_after_val - info.inpool_init_val) / \
-                        (info.outpool_init_val - info.outpool_after_val)
-                drained = 1 - info.outpool_after_val / info.outpool_init_val
-                rate = info.after_rate / rate
-                result = [drained, abs(rate)]
-
-                if info.outpool_after_val < info.outpool_init_val and \
-                    not info.in_type in crash_types and info.after_rate >= 0:
-                    if rate > 1:
-                        pos_results.append(result)
-                    else:
-                        neg_results.append(result)
-                
-                    monitor = __match_monitor(info, monitors)
-                    if monitor != None:
-                        if rate > 1:
-                            monitor_results[monitor][0].append(result)
-                        else:
-                            monitor_results[monitor][1].append(result)
-            except ZeroDivisionError:
-                continue
+    columns, pairs, codes, crashed = __outputs_to_arrays(output, crash_types)
+    rate, drained, no_error = __swap_rates(columns)
+    after_rate = columns["after_rate"]
 
-    proc_pos = remove_outliers(pos_results, OUTLIER_PERC)
-    proc_neg = remove_outliers(neg_results, OUTLIER_PERC)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratios = after_rate / rate
 
-    for v in monitor_results.values():
-        pos, neg = v[0], v[1]
-        v[2], v[3] = remove_outliers(pos, OUTLIER_PERC), remove_outliers(neg, OUTLIER_PERC)
-        v.append(get_stats(pos))
-        v.append(get_stats(neg))
-        v.append(get_stats(v[2]))
-        v.append(get_stats(v[3]))
-    
-    return pos_results, neg_results, proc_pos, proc_neg, \
-    get_stats(pos_results), get_stats(neg_results), get_stats(proc_pos), get_stats(proc_neg), \
-    monitor_results
+    # swaps that divide by zero are skipped
+    keep = no_error & (rate != 0) & \
+        (columns["outpool_after_val"] < columns["outpool_init_val"]) & ~crashed & (after_rate >= 0)
+    pos = ratios > 1
+    pos_results, neg_results = __split_results(drained, ratios, keep, pos)
+    monitor_results = __monitor_results(pairs, codes, drained, ratios, keep, pos, monitors)
+
+    return __summarize(pos_results, neg_results, monitor_results)
 
 def capital_efficiency(output: List[List[OutputTx]], crash_types: List[str], monitors: set[str]
-) -> Tuple[List[Tuple[float, float]], List[Tuple[float, float]],
-    List[Tuple[float, float]], List[Tuple[float, float]], 
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray,
     Dict[str, float], Dict[str, float], Dict[str, float], Dict[str, float], Dict]:
     """
     Measures deviation from market swap rate as function of proportion of output
@@ -199,54 +348,45 @@ def capital_efficiency(output: List[List[OutputTx]], crash_types: List[str], mon
     8. statistics of swaps when rate ratios > 1, outliers removed
     9. statistics and rate ratios for tokens or pools to be monitored
     """
-    pos_results = []
-    neg_results = []
-    monitor_results = {i : [[],[],[],[]] for i in monitors}
-
-    for batch in output:
-        for info in batch:
-            try:
-                rate = (info.inpool_after_val - info.inpool_init_val) / \
-                    (info.outpool_init_val - info.outpool_after_val)
-                drained = 1 - info.outpool_after_val / info.outpool_init_val
-                rate = rate / info.market_rate
-                result = ([drained, abs(rate)])
-
-                if info.outpool_after_val < info.outpool_init_val and \
-                    not info.in_type in crash_types:
-                    if rate <= 1:
-                        pos_results.append(result)
-                    else:
-                        neg_results.append(result)
-
-                monitor = __match_monitor(info, monitors)
-                if monitor != None:
-                    if rate <= 1:
-                        monitor_results[monitor][0].append(result)
-                    else:
-                        monitor_results[monitor][1].append(result)
-            except ZeroDivisionError:
-                continue
+    columns, pairs, codes, crashed = __outputs_to_arrays(output, crash_types)
+    rate, drained, no_error = __swap_rates(columns)
+    market_rate = columns["market_rate"]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratios = rate / market_rate
+
+    # swaps that divide by zero are skipped; monitors also see swaps that
+    # did not remove any output token
+    no_error &= market_rate != 0
+    keep = no_error & (columns["outpool_after_val"] < columns["outpool_init_val"]) & ~crashed
+    pos = ratios <= 1
+    pos_results, neg_results = __split_results(drained, ratios, keep, pos)
+    monitor_results = __monitor_results(pairs, codes, drained, ratios, no_error, pos, monitors)
     
-    proc_pos = remove_outliers(pos_results, OUTLIER_PERC)
-    proc_neg = remove_outliers(neg_results, OUTLIER_PERC)
+    return __summarize(pos_results, neg_results, monitor_results)
 
-    for v in monitor_results.values():
-        pos, neg = v[0], v[1]
-        v[2], v[3] = remove_outliers(pos, OUTLIER_PERC), remove_outliers(neg, OUTLIER_PERC)
-        v.append(get_stats(pos))
-        v.append(get_stats(neg))
-        v.append(get_stats(v[2]))
-        v.append(get_stats(v[3]))
+def __split_changes(changes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Pairs balance ratios with the swap they were measured after
 
-    return pos_results, neg_results, proc_pos, proc_neg, \
-    get_stats(pos_results), get_stats(neg_results), get_stats(proc_pos), get_stats(proc_neg), \
-    monitor_results
+    Parameters:
+    1. changes: balance ratios, one row per swap
+
+    Returns:
+    1. [swap number, ratio] for every ratio >= 1, in order of swap and then column
+    2. [swap number, ratio] for every ratio < 1, in order of swap and then column
+    """
+    gains = changes >= 1
+    counters = np.broadcast_to(np.arange(1, len(changes) + 1, dtype=np.float64)[:, None],
+        changes.shape)
+
+    return np.column_stack((counters[gains], np.abs(changes[gains]))), \
+        np.column_stack((counters[~gains], np.abs(changes[~gains])))
 
 def impermanent_loss(initial: PoolStatusInterface, history: List[List[PoolStatusInterface]],
 crash_types: List[str], monitors: set[str]) -> Tuple[
-    List[Tuple[int, float]], List[Tuple[int, float]], List[Tuple[int, float]], List[Tuple[int, float]],
-    List[Tuple[int, float]], List[Tuple[int, float]], List[Tuple[int, float]], List[Tuple[int, float]],
+    np.ndarray, np.ndarray, np.ndarray, np.ndarray,
+    np.ndarray, np.ndarray, np.ndarray, np.ndarray,
     Dict[str, float], Dict[str, float], Dict[str, float], Dict[str, float],
     Dict[str, float], Dict[str, float], Dict[str, float], Dict[str, float],
     Dict]:
@@ -279,54 +419,42 @@ crash_types: List[str], monitors: set[str]) -> Tuple[
     16. statistics on median balance ratios, outliers removed
     17. statistics and ratios for tokens or pools to be monitored
     """
-    pos_results = []
-    neg_results = []
-    averages = []
-    medians = []
     monitor_results = {i : [[],[],[],[]] for i in monitors}
-    swap_counter = 1
+    tokens = list(initial)
+    counters = np.arange(1, sum(len(batch) for batch in history) + 1, dtype=np.float64)
 
+    # one row of balance ratios per swap; snapshots share the row order of the
+    # initial pool status; results are [swap number, ratio] rows
+    changes = np.empty((len(counters), len(tokens)), dtype=np.float64)
+    row = 0
     for batch in history:
         for status in batch:
-            no_crash_hits = 0
-            avg = 0
-            changes = []
-            for token in initial:
-                change = status[token][0] / initial[token][0]
-                if not token in crash_types:
-                    changes.append(change)
-                    avg += change
-                    no_crash_hits += 1
-                    if change >= 1:
-                        pos_results.append((swap_counter, abs(change)))
-                    else:
-                        neg_results.append((swap_counter, abs(change)))
-                
-                pool = ""
-                if isinstance(token, Tuple):
-                    tok1, tok2 = token[0], token[1]
-                    if tok1 <= tok2:
-                        pool = tok1 + ", " + tok2
-                    else:
-                        pool = tok2 + ", " + tok1
-                
-                found = None
-                if token in monitor_results:
-                    found = token
-                elif pool in monitor_results:
-                    found = pool
-
-                if found != None:
-                    if change >= 1:
-                        monitor_results[found][0].append((swap_counter, abs(change)))
-                    else:
-                        monitor_results[found][1].append((swap_counter, abs(change)))           
-            
-            avg /= no_crash_hits
-            medians.append([swap_counter, statistics.median(changes)])
-            averages.append([swap_counter, avg])
-            
-            swap_counter += 1
+            changes[row] = status.array[:, 0]
+            row += 1
+    changes /= initial.array[:, 0]
+    crash_set = frozenset(crash_types)
+    crashed = np.array([token in crash_set for token in tokens], dtype=bool)
+    no_crash_changes = changes[:, ~crashed]
+
+    pos_results, neg_results = __split_changes(no_crash_changes)
+    avg = np.zeros(len(counters))
+    for c in range(no_crash_changes.shape[1]):
+        avg += no_crash_changes[:, c]
+    avg /= no_crash_changes.shape[1]
+    averages = np.column_stack((counters, avg))
+    medians = np.column_stack((counters, np.median(no_crash_changes, axis=1)))
+
+    # each token or pool is matched to a monitor once, not once per swap
+    monitor_columns = {}
+    for c, token in enumerate(tokens):
+        if token in monitor_results:
+            monitor_columns.setdefault(token, []).append(c)
+        elif isinstance(token, Tuple) and __pool_name(token[0], token[1]) in monitor_results:
+            monitor_columns.setdefault(__pool_name(token[0], token[1]), []).append(c)
+
+    for monitor, columns in monitor_columns.items():
+        monitor_results[monitor][0], monitor_results[monitor][1] = \
+            __split_changes(changes[:, columns])
     
     proc_pos = remove_outliers(pos_results, OUTLIER_PERC)
     proc_neg = remove_outliers(neg_results, OUTLIER_PERC)
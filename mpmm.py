@@ -1,10 +1,10 @@
-from typing import List, Tuple
+from typing import List, Tuple, Dict
 from imarketmaker import MarketMakerInterface
 from inputtx import InputTx
 from outputtx import OutputTx
 from poolstatus import MultiTokenPoolStatus
-from copy import deepcopy
-from math import sqrt
+from math import sqrt, isfinite, isnan, hypot, cos, atan2, nan
+import numpy as np
 
 class MPMM(MarketMakerInterface):
     def __init__(self, pairwise_pools: List[Tuple[str, str]], pairwise_infos: List[Tuple[float, float, float]], 
@@ -20,6 +20,18 @@ class MPMM(MarketMakerInterface):
         """
         super().__init__(pairwise_pools, pairwise_infos, single_pools, single_infos)
         self.float_tolerance = 1e-5
+        self.equilibrium_cache = {}
+
+    def set_prices(self, prices: Dict[str, float]):
+        """
+        Sets token prices and the market exchange rates between every pair of
+        tokens; equilibriums cached at the previous prices are dropped
+
+        Parameters:
+        1. prices: maps tokens to prices
+        """
+        super().set_prices(prices)
+        self.equilibrium_cache.clear()
     
     def getK(self, intype: str, outtype: str) -> float:
         """
@@ -34,12 +46,12 @@ class MPMM(MarketMakerInterface):
         """
         return max(self.token_info[intype][1], self.token_info[outtype][1])
 
-    def __argMin(self, s: float, l: float, k: float, p: float, S: float, L: float
-    ) -> float:
+    def __cubicTerms(self, s: float, l: float, k: float, p: float, S: float, L: float
+    ) -> Tuple[float, float, float, float]:
         """
-        Subject to the constraint of a shortage and excess token type, finds the
-        an equilibrium balance for the excess token type that minimizes the distance
-        to a desired equilibrium determined from the pool's initial balances
+        Calculates the terms of the closed form solution for the optimal excess
+        token equilibrium point; only uses arithmetic, so it also applies elementwise
+        to arrays
 
         Parameters:
         1. s: shortage token balance
@@ -50,61 +62,67 @@ class MPMM(MarketMakerInterface):
         6. L: excess token balance at pool's initialization
 
         Returns:
-        1. optimal excess token equilibrium point
+        1. x1 term
+        2. x3 term
+        3. x4 term
+        4. t35 term
         """
-        t1 = 4*k*L**2*p*s*S**2
-        t2 = 4*k**2*l*p**2*S**4
-        t3 = 8*k**2*L*p**2*S**4
-        t4 = k*p**3*s*S**4
-        t5 = L**4*s**2+4*k*l*L**2*p*s*S**2
-        t6 = 4*k*L**3*p*s*S**2
-        t7 = L**2*p**2*s**2*S**2
-        t8 = 8*k**2*l*L*p**2*S**4
-        t9 = 4*k**2*L**2*p**2*S**4
-        t10 = 2*k*L*p**3*s*S**4
-        t11 = 1024*k**3*L**6*p**3*s**3*S**6
-        t12 = 6144*k**4*l*L**4*p**4*s**2*S**8
-        t13 = 6144*k**4*L**5*p**4*s**2*S**8
-        t14 = 5376*k**3*L**4*p**5*s**3*S**8
-        t15 = 27648*k**4*L**4*p**5*s**3*S**8
-        t16 = 27648*k**5*L**4*p**5*s**3*S**8
-        t17 = 27648*k**4*L**4*p**5*s**2*S**9
-        t18 = 55296*k**5*L**4*p**5*s**2*S**9
-        t19 = 12288*k**5*l**2*L**2*p**5*s*S**10
-        t20 = 24576*k**5*l*L**3*p**5*s*S**10
-        t21 = 39936*k**5*L**4*p**5*s*S**10
-        t22 = 6144*k**4*l*L**2*p**6*s**2*S**10
-        t23 = 6144*k**4*L**3*p**6*s**2*S**10
-        t24 = 768*k**3*L**2*p**7*s**3*S**10
-        t25 = 8192*k**6*l**3*p**6*S**12
-        t26 = 24576*k**6*l**2*L*p**6*S**12
-        t27 = 24576*k**6*l*L**2*p**6*S**12
-        t28 = 8192*k**6*L**3*p**6*S**12
-        t29 = 6144*k**5*l**2*p**7*s*S**12
-        t30 = 12288*k**5*l*L*p**7*s*S**12
-        t31 = 6144*k**5*L**2*p**7*s*S**12
-        t32 = 1536*k**4*l*p**8*s**2*S**12
-        t33 = 1536*k**4*L*p**8*s**2*S**12
-        t34 = 128*k**3*p**9*s**3*S**12
-        t35 = k**2*p**2*S**4
+        # each power is built once and shared by the terms below
+        k2, l2, L2, p2, s2, S2 = k*k, l*l, L*L, p*p, s*s, S*S
+        k3, l3, L3, p3, s3 = k2*k, l2*l, L2*L, p2*p, s2*s
+        k4, L4, p4, S4 = k2*k2, L2*L2, p2*p2, S2*S2
+        k5, L5, p5, S6, S8 = k4*k, L4*L, p4*p, S4*S2, S4*S4
+        k6, L6, p6, S9, S10, S12 = k3*k3, L3*L3, p3*p3, S8*S, S8*S2, S6*S6
+        p7, p8, p9 = p6*p, p4*p4, p6*p3
+
+        t1 = 4*k*L2*p*s*S2
+        t2 = 4*k2*l*p2*S4
+        t3 = 8*k2*L*p2*S4
+        t4 = k*p3*s*S4
+        t5 = L4*s2+4*k*l*L2*p*s*S2
+        t6 = 4*k*L3*p*s*S2
+        t7 = L2*p2*s2*S2
+        t8 = 8*k2*l*L*p2*S4
+        t9 = 4*k2*L2*p2*S4
+        t10 = 2*k*L*p3*s*S4
+        t11 = 1024*k3*L6*p3*s3*S6
+        t12 = 6144*k4*l*L4*p4*s2*S8
+        t13 = 6144*k4*L5*p4*s2*S8
+        t14 = 5376*k3*L4*p5*s3*S8
+        t15 = 27648*k4*L4*p5*s3*S8
+        t16 = 27648*k5*L4*p5*s3*S8
+        t17 = 27648*k4*L4*p5*s2*S9
+        t18 = 55296*k5*L4*p5*s2*S9
+        t19 = 12288*k5*l2*L2*p5*s*S10
+        t20 = 24576*k5*l*L3*p5*s*S10
+        t21 = 39936*k5*L4*p5*s*S10
+        t22 = 6144*k4*l*L2*p6*s2*S10
+        t23 = 6144*k4*L3*p6*s2*S10
+        t24 = 768*k3*L2*p7*s3*S10
+        t25 = 8192*k6*l3*p6*S12
+        t26 = 24576*k6*l2*L*p6*S12
+        t27 = 24576*k6*l*L2*p6*S12
+        t28 = 8192*k6*L3*p6*S12
+        t29 = 6144*k5*l2*p7*s*S12
+        t30 = 12288*k5*l*L*p7*s*S12
+        t31 = 6144*k5*L2*p7*s*S12
+        t32 = 1536*k4*l*p8*s2*S12
+        t33 = 1536*k4*L*p8*s2*S12
+        t34 = 128*k3*p9*s3*S12
+        t35 = k2*p2*S4
         x1 = t1+t2+t3+t4
         x2 = t5+t6+t7+t8+t9+t10
         x3 = t11-t12+t13+t14-t15+t16+t17-t18+t19-t20+t21+t22-t23+t24-t25+t26-t27+t28-t29+t30-t31-t32+t33-t34
-        x4 = -16*x1**2+192*t35*x2
-        x5 = (x3+(x3**2+4*x4**3)**0.5)**(1/3)
+        x4 = -16*x1*x1+192*t35*x2
 
-        ans = x1/(12*t35)+x4/(24*2**(2/3)*t35*x5)-(1/(48*2**(1/3)*t35))*x5
-        if isinstance(ans, complex):
-            return ans.real
-        else:
-            return ans
-    
-    def __newtonMethod(self, s: float, l: float, k: float, p: float, S: float, L: float
-    ) -> float:
+        return x1, x3, x4, t35
+
+    def __getEquilibrium(self, s: float, l: float, k: float, p: float, S: float, L: float
+    ) -> Tuple[float, float]:
         """
         Subject to the constraint of a shortage and excess token type, finds the
-        an equilibrium balance for the excess token type that minimizes the distance
-        to a desired equilibrium determined from the pool's initial balances
+        equilibrium balances that minimize the distance to a desired equilibrium
+        determined from the pool's initial balances
 
         Parameters:
         1. s: shortage token balance
@@ -115,147 +133,122 @@ class MPMM(MarketMakerInterface):
         6. L: excess token balance at pool's initialization
 
         Returns:
-        1. optimal excess token equilibrium point
-        """
-        approx = min(s/S, l/L) * min([s, S, l, L])
-        new_approx = self.__update_approx(approx, s, l, k, p, S, L)
-        i = 0
-        while abs(new_approx - approx) > self.float_tolerance:
-            approx = new_approx
-            new_approx = self.__update_approx(approx, s, l, k, p, S, L)
-            i += 1
-            if i >= 1000:
-                print({"s": s, "l": l, "k": k, "p": p, "S": S, "L": L})
-                print(1/0)
-
-        return new_approx
-    
-    def __update_approx(self, x: float, s: float, l: float, k: float, p: float, S: float, L: float
-    ) -> float:
+        1. equilibrium balance for shortage token type, or nan if it is not real
+        2. optimal excess token equilibrium point
         """
-        Updates apprximation for long equilibrium point
+        x1, x3, x4, t35 = self.__cubicTerms(s, l, k, p, S, L)
+        disc = x3*x3+4*x4*x4*x4
+        if not isfinite(disc):
+            # products overflow to inf where powers raised
+            raise OverflowError("Numerical result out of range")
+        if disc >= 0:
+            v = x3+sqrt(disc)
+            # the principal cube root of a negative value lies at an angle of pi/3,
+            # so only half of its magnitude is real
+            if v >= 0:
+                x5, scale = v**(1/3), 1
+            else:
+                x5, scale = (-v)**(1/3), 0.5
+        else:
+            # a negative discriminant takes the cube root of x3+i*sqrt(-disc); only the
+            # real part is kept, which is its magnitude scaled by the cosine of a third
+            # of its angle
+            im = sqrt(-disc)
+            x5, scale = hypot(x3, im)**(1/3), cos(atan2(im, x3)/3)
 
-        Parameters:
-        1. x: current long equilibrium approximation
-        2. s: shortage token balance
-        3. l: excess token balance
-        4. k: k parameter between 2 token types
-        5. p: exchange rates in units of excess tokens / shortage tokens
-        6. S: shortage token balance at pool's initialization
-        7. L: excess token balance at pool's initialization
+        # t35 is factored out, and constant divisors fold into reciprocals
+        l_e = (x1*(1/12)+scale*(x4/x5*(1/(24*2**(2/3)))-x5*(1/(48*2**(1/3)))))/t35
 
-        Returns:
-        1. updated long token equilibrium point
-        """
-        func = self.__first_deriv(x, s, l, k, p, S, L)
-        deriv = self.__second_deriv(x, s, l, k, p, S, L)
-        new_x = x - func / deriv
-        
-        while True:
-            try:
-                new_func = self.__first_deriv(new_x, s, l, k, p, S, L)
-                new_deriv =  self.__second_deriv(new_x, s, l, k, p, S, L)
-                if new_func != new_func or new_deriv != new_deriv or isinstance(new_func, complex) or isinstance(new_deriv, complex):
-                    new_x = (x + new_x) / 2
-                else:
-                    break
-            except:
-                new_x = (x + new_x) / 2
-        
-        return new_x
-    
-    def __first_deriv(self, x: float, s: float, l: float, k: float, p: float, S: float, L: float
-    ) -> float:
-        """
-        Calculates first derivative of function to minimize
+        u = 1 + (4*k * (l - l_e)) / (s * p)
+        if not u >= 0:
+            # no real shortage balance, which calculate_equilibriums rejects
+            return nan, l_e
 
-        Parameters:
-        1. x: current long equilibrium approximation
-        2. s: shortage token balance
-        3. l: excess token balance
-        4. k: k parameter between 2 token types
-        5. p: exchange rates in units of excess tokens / shortage tokens
-        6. S: shortage token balance at pool's initialization
-        7. L: excess token balance at pool's initialization
+        return s + s / (2*k) * (sqrt(u) - 1), l_e
 
-        Returns:
-        1. first derivative
+    def __getEquilibriums(self, s: np.ndarray, l: np.ndarray, k: np.ndarray, p: np.ndarray,
+    S: np.ndarray, L: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
         """
-        return (2*(1-((s*(sqrt((4*k*(l-x))/(p*s)+1)-1))/(2*k)+s)/S))/(S*p*sqrt((4*k*(l-x))/(p*s)+1))-(2*(1-x/L))/L
-    
-    def __second_deriv(self, x: float, s: float, l: float, k: float, p: float, S: float, L: float
-    ) -> float:
-        """
-        Calculates second derivative of function to minimize
+        Vectorized version of __getEquilibrium; results which are not finite are
+        left for the caller to detect, rather than raised
 
         Parameters:
-        1. x: current long equilibrium approximation
-        2. s: shortage token balance
-        3. l: excess token balance
-        4. k: k parameter between 2 token types
-        5. p: exchange rates in units of excess tokens / shortage tokens
-        6. S: shortage token balance at pool's initialization
-        7. L: excess token balance at pool's initialization
+        1. s: shortage token balances
+        2. l: excess token balances
+        3. k: k parameters between each 2 token types
+        4. p: exchange rates in units of excess tokens / shortage tokens
+        5. S: shortage token balances at pool's initialization
+        6. L: excess token balances at pool's initialization
 
         Returns:
-        1. second derivative
+        1. equilibrium balances for shortage token types
+        2. equilibrium balances for excess token types
+        3. whether each equilibrium is real
         """
-        return 2/(S**2*p**2*((4*k*(l-x))/(p*s)+1))+(4*k*(1-((s*(sqrt((4*k*(l-x))/(p*s)+1)-1))/(2*k)+s)/S))/(S*p**2*s*((4*k*(l-x))/(p*s)+1)**(3/2))+2/L**2
-    
-    def calculate_equilibriums(self, intype: str, outtype: str) -> Tuple[float, float]:
+        x1, x3, x4, t35 = self.__cubicTerms(s, l, k, p, S, L)
+        disc = x3*x3+4*x4*x4*x4
+
+        # real part of the principal cube root of x3+sqrt(disc), taken in polar form
+        re = x3+np.sqrt(np.maximum(disc, 0))
+        im = np.sqrt(np.maximum(-disc, 0))
+        x5 = np.hypot(re, im)**(1/3)
+        scale = np.cos(np.arctan2(im, re)/3)
+        l_e = (x1*(1/12)+scale*(x4/x5*(1/(24*2**(2/3)))-x5*(1/(48*2**(1/3)))))/t35
+        u = 1 + (4*k * (l - l_e)) / (s * p)
+
+        return s + s / (2*k) * (np.sqrt(u) - 1), l_e, u >= 0
+
+    def calculate_equilibriums(self, intype: str, outtype: str, k: float = None, p: float = None
+    ) -> Tuple[float, float]:
         """
         Calculates and returns equilibrium balances
 
         Parameters:
         1. intype: input token type
         2. outtype: output token type
+        3. k: k parameter between the 2 token types, looked up if not given
+        4. p: market exchange rate from intype to outtype, looked up if not given
 
         Returns:
         1. equilibrium balance for input token
         2. equilibrium balance for output token
         """
-        k = self.getK(intype, outtype)
-        p = self.prices[outtype] / self.prices[intype]
-        lst = []
+        if k == None:
+            k = self.getK(intype, outtype)
+        if p == None:
+            p = self.market_rates[intype][outtype]
         I, O = self.equilibriums[intype][0], self.equilibriums[outtype][0]
-
         in_0, out_0 = self.token_info[intype][0], self.token_info[outtype][0]
-        lst.append(((in_0, out_0), self.__distSq(I, O, in_0, out_0)))
-
-        in_1, out_1 = self.__getEquilibrium(intype, outtype, k, 1 / p)
-        if not(isinstance(in_1, complex) or isinstance(out_1, complex)):
-            if (in_1 + self.float_tolerance >= in_0 and out_0 + self.float_tolerance >= out_1) or \
-                (out_1 + self.float_tolerance >= out_0 and in_0 + self.float_tolerance >= in_1):
-                lst.append(((in_1, out_1), self.__distSq(I, O, in_1, out_1)))
-
-        out_2, in_2 = self.__getEquilibrium(outtype, intype, k, p)
-        if not(isinstance(in_2, complex) or isinstance(out_2, complex)):
-            if (in_2 + self.float_tolerance >= in_0 and out_0 + self.float_tolerance >= out_2) or \
-                (out_2 + self.float_tolerance >= out_0 and in_0 + self.float_tolerance >= in_2):
-                lst.append(((in_2, out_2), self.__distSq(I, O, in_2, out_2)))
-
-        lst = sorted(lst, key=lambda x: x[1])
 
-        return lst[0][0][0], lst[0][0][1]
+        # the equilibriums only depend on these values, so pools which return to a
+        # previous state (arbitrage, or reset after every swap) reuse the result
+        key = (k, p, I, O, in_0, out_0)
+        cached = self.equilibrium_cache.get(key)
+        if cached != None:
+            return cached
+
+        tol = self.float_tolerance
+        best_in, best_out = in_0, out_0
+        best_dist = self.__distSq(I, O, in_0, out_0)
+
+        # balances already read above are handed down rather than looked up again
+        in_1, out_1 = self.__getEquilibrium(in_0, out_0, k, 1 / p, I, O)
+        out_2, in_2 = self.__getEquilibrium(out_0, in_0, k, p, O, I)
+        # candidates only replace the best one when strictly closer, so ties keep
+        # the earlier candidate
+        for cand_in, cand_out in ((in_1, out_1), (in_2, out_2)):
+            if isnan(cand_in) or isnan(cand_out):
+                continue
+            if (cand_in + tol >= in_0 and out_0 + tol >= cand_out) or \
+                (cand_out + tol >= out_0 and in_0 + tol >= cand_in):
+                dist = self.__distSq(I, O, cand_in, cand_out)
+                if dist < best_dist:
+                    best_in, best_out, best_dist = cand_in, cand_out, dist
+
+        self.equilibrium_cache[key] = best_in, best_out
+
+        return best_in, best_out
     
-    def __getEquilibrium(self, short: str, long: str, k: float, p: float) -> Tuple[float, float]:
-        """
-        Calculates and returns equilibrium balances given a short and long token type
-
-        Parameters:
-        1. short: shortage token type
-        2. long: excess token type
-
-        Returns:
-        1. equilibrium balance for shortage token type
-        2. equilibrium balance for excess token type
-        """
-        s = self.token_info[short][0]
-        l = self.token_info[long][0]
-        l_e = self.__argMin(s, l, k, p, self.equilibriums[short][0], self.equilibriums[long][0])
-
-        return s + s / (2*k) * ((1 + (4*k * (l - l_e)) / (s * p))**0.5 - 1), l_e
-
     def __distSq(self, x0: float, y0: float, x1: float, y1: float) -> float:
         """
         Calculates how far a pair of token balance are from the desired equilibrium
@@ -304,8 +297,42 @@ class MPMM(MarketMakerInterface):
         Returns:
         1. Shortage token balance
         """
-        return (y-L-p*S+2*k*p*S-(y**2-2*y*L+L**2-2*y*p*S+4*k*y*p*S+2*L*p*S-4*k*L*p*S+p**2*S**2)**0.5)\
-            /(2*(-1+k)*p)
+        # the expanded radicand regroups to (y-L+pS(2k-1))^2 + 4k(1-k)(pS)^2, which
+        # cannot be negative for 0 <= k <= 1
+        pS = p*S
+        r = y-L+pS*(2*k-1)
+        return (r-sqrt(r*r+4*k*(1-k)*pS*pS))/(2*(k-1)*p)
+
+    def __out_amount(self, tx: InputTx) -> float:
+        """
+        Finds the amount of output token removed by a swap from the pool's
+        current balances
+
+        Parameters:
+        1. tx: transaction
+
+        Returns:
+        1. amount of output token removed
+        """
+        intype, outtype, d = tx.intype, tx.outtype, tx.inval
+        i_0, o_0 = self.token_info[intype][0], self.token_info[outtype][0]
+        k = self.getK(intype, outtype)
+        p = self.market_rates[intype][outtype]
+        in_e, out_e = self.calculate_equilibriums(intype, outtype, k, p)
+
+        if o_0 / out_e > i_0 / in_e:
+            s_e, l_e = in_e, out_e
+            static_amt = s_e - i_0
+
+            if static_amt < d:
+                new_pt = self.__solveShort(d - static_amt + s_e, s_e, l_e, p, k)
+            else:
+                new_pt = self.__solveLong(i_0 + d, l_e, s_e, 1/p, k)
+        else:
+            s_e, l_e = out_e, in_e
+            new_pt = self.__solveShort(i_0 + d, l_e, s_e, p, k)
+
+        return o_0 - new_pt
 
     def swap(self, tx: InputTx, out_amt: float = None, execute: bool = True
     ) -> Tuple[OutputTx, MultiTokenPoolStatus]:
@@ -322,36 +349,65 @@ class MPMM(MarketMakerInterface):
         1. output information associated with swap (after_rate is incorrect)
         2. status of pool ater swap
         """
-        i_0, o_0 = self.token_info[tx.intype][0], self.token_info[tx.outtype][0]
-        in_e, out_e = self.calculate_equilibriums(tx.intype, tx.outtype)
         if out_amt == None:
-            d = tx.inval
-            k = self.getK(tx.intype, tx.outtype)
-            p = self.prices[tx.outtype] / self.prices[tx.intype]     
-
-            if o_0 / out_e > i_0 / in_e:
-                s_e, l_e = in_e, out_e
-                static_amt = s_e - i_0
-
-                if static_amt < d:
-                    new_pt = self.__solveShort(d - static_amt + s_e, s_e, l_e, p, k)
-                else:
-                    new_pt = self.__solveLong(i_0 + d, l_e, s_e, 1/p, k)
-            else:
-                s_e, l_e = out_e, in_e
-                new_pt = self.__solveShort(i_0 + d, l_e, s_e, p, k)
-        
-        if out_amt == None:
-            output_tx, pool_stat = super().swap(tx, o_0 - new_pt, execute)
-        else:
-            output_tx, pool_stat = super().swap(tx, out_amt, execute)
+            out_amt = self.__out_amount(tx)
+        output_tx, pool_stat = super().swap(tx, out_amt, execute)
 
         if execute:
-            o, _ = self.swap(tx, None, False)
+            # rate the same swap would get from the balances it left behind
+            after_amt = self.__out_amount(tx)
             try:
-                output_tx.after_rate = tx.inval / \
-                    (o.outpool_init_val - o.outpool_after_val)
+                output_tx.after_rate = tx.inval / after_amt
             except ZeroDivisionError:
                 pass
         
         return output_tx, pool_stat
+
+    def getRates(self, pools: List[Tuple[str, str]], cache: Dict = None
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns statistics about moving many token pairs to an equilibrium; if
+        any pool has no finite equilibrium, falls back to getRate for every pool
+
+        Parameters:
+        1. pools: token pools, in order of intype and outtype
+        2. cache: only used when falling back to getRate
+
+        Returns:
+        1. amounts of intype token to input to reach equilibrium
+        2. amounts of outtype token to remove to reach equilibrium
+        3. ratios of internal exchange rate to market rate
+        """
+        index, tol = self.token_info.index, self.float_tolerance
+        ins = [index[pool[0]] for pool in pools]
+        outs = [index[pool[1]] for pool in pools]
+        balances, ks = self.token_info.array[:, 0], self.token_info.array[:, 1]
+        equilibriums = self.equilibriums.array[:, 0]
+        in_0, out_0, I, O = balances[ins], balances[outs], equilibriums[ins], equilibriums[outs]
+        k = np.maximum(ks[ins], ks[outs])
+        market_rates = np.array([self.market_rates[pool[0]][pool[1]] for pool in pools],
+            dtype=np.float64)
+
+        with np.errstate(all="ignore"):
+            in_1, out_1, real_1 = self.__getEquilibriums(in_0, out_0, k, 1 / market_rates, I, O)
+            out_2, in_2, real_2 = self.__getEquilibriums(out_0, in_0, k, market_rates, O, I)
+
+            # same candidates and tie breaking as calculate_equilibriums
+            in_e, out_e = in_0, out_0
+            best_dist = self.__distSq(I, O, in_0, out_0)
+            finite = np.isfinite(best_dist) & np.isfinite(out_1) & np.isfinite(in_2)
+            for cand_in, cand_out, real in ((in_1, out_1, real_1), (in_2, out_2, real_2)):
+                dist = self.__distSq(I, O, cand_in, cand_out)
+                closer = real & (((cand_in + tol >= in_0) & (out_0 + tol >= cand_out)) |
+                    ((cand_out + tol >= out_0) & (in_0 + tol >= cand_in))) & (dist < best_dist)
+                finite &= ~real | (np.isfinite(cand_in) & np.isfinite(cand_out))
+                in_e, out_e = np.where(closer, cand_in, in_e), np.where(closer, cand_out, out_e)
+                best_dist = np.where(closer, dist, best_dist)
+
+        if not finite.all():
+            # the scalar path raises the same errors as swapping would
+            return super().getRates(pools, cache)
+
+        in_amts, out_amts = in_e - in_0, out_0 - out_e
+
+        return in_amts, out_amts, self.compareRates(market_rates, in_amts, out_amts)
@@ -1,5 +1,8 @@
 
 class OutputTx:
+    __slots__ = ("in_type", "out_type", "inpool_init_val", "outpool_init_val",
+        "inpool_after_val", "outpool_after_val", "market_rate", "after_rate")
+
     def __init__(self,
                  in_type: str,
                  out_type: str,
@@ -1,9 +1,11 @@
-from typing import List, Tuple
+from typing import List, Tuple, Dict
 from imarketmaker import MarketMakerInterface
 from inputtx import InputTx
 from outputtx import OutputTx
 from poolstatus import PairwiseTokenPoolStatus
 import json
+import numpy as np
+from math import sqrt
 
 class PMM(MarketMakerInterface):
     def __init__(self, pairwise_pools: List[Tuple[str, str]],
@@ -52,9 +54,49 @@ class PMM(MarketMakerInterface):
         Returns:
         1. shortage token balance
         """
-        return (y-L-p*S+2*k*p*S-(y**2-2*y*L+L**2-2*y*p*S+4*k*y*p*S+2*L*p*S-4*k*L*p*S+p**2*S**2)**0.5)\
-            /(2*(-1+k)*p)
+        # the expanded radicand regroups to (y-L+pS(2k-1))^2 + 4k(1-k)(pS)^2,
+        # which is never negative for 0 <= k <= 1
+        pS = p*S
+        r = y-L+pS*(2*k-1)
+        return (r-sqrt(r*r+4*k*(1-k)*pS*pS))/(2*(k-1)*p)
     
+    def __out_amount(self, tx: InputTx, in_e: float, out_e: float) -> float:
+        """
+        Finds the amount of output token removed by a swap from the pool's
+        current balances
+
+        Parameters:
+        1. tx: transaction
+        2. in_e: equilibrium balance for input token
+        3. out_e: equilibrium balance for output token
+
+        Returns:
+        1. amount of output token removed
+        """
+        pool_info = self.pools[tx.intype][tx.outtype]
+        i_0, o_0, k = pool_info[0], pool_info[1], pool_info[2]
+        d = tx.inval
+        p = self.market_rates[tx.intype][tx.outtype]
+
+        if in_e == 0 or out_e == 0:
+            raise ZeroDivisionError("equilibrium balance is zero")
+
+        # o_0 / out_e > i_0 / in_e cross-multiplied; the in_e * out_e factor keeps
+        # the comparison's direction when an equilibrium has gone negative
+        if (o_0 * in_e - i_0 * out_e) * (in_e * out_e) > 0:
+            s_e, l_e = in_e, out_e
+            static_amt = s_e - i_0
+
+            if static_amt < d:
+                new_pt = self.__solveShort(d - static_amt + s_e, s_e, l_e, p, k)
+            else:
+                new_pt = self.__solveLong(i_0 + d, l_e, s_e, 1/p, k)
+        else:
+            s_e, l_e = out_e, in_e
+            new_pt = self.__solveShort(i_0 + d, l_e, s_e, p, k)
+
+        return o_0 - new_pt
+
     def swap(self, tx: InputTx, out_amt: float = None, execute: bool = True
     ) -> Tuple[OutputTx, PairwiseTokenPoolStatus]:
         """
@@ -71,40 +113,24 @@ class PMM(MarketMakerInterface):
         2. status of pool ater swap
         """
         pool = (tx.intype, tx.outtype)
-        i_0 = self.token_info[pool][0]
-        o_0 = self.token_info[pool][1]
         in_e, out_e = self.calculate_equilibriums(tx.intype, tx.outtype)
-        k = self.token_info[pool][2]
         
         if out_amt == None:
-            d = tx.inval
-            p = self.prices[tx.outtype] / self.prices[tx.intype]
-
-            if o_0 / out_e > i_0 / in_e:
-                s_e, l_e = in_e, out_e
-                static_amt = s_e - i_0
-
-                if static_amt < d:
-                    new_pt = self.__solveShort(d - static_amt + s_e, s_e, l_e, p, k)
-                else:
-                    new_pt = self.__solveLong(i_0 + d, l_e, s_e, 1/p, k)
-            else:
-                s_e, l_e = out_e, in_e
-                new_pt = self.__solveShort(i_0 + d, l_e, s_e, p, k)
-        
-        if out_amt == None:
-            output_tx, pool_stat = super().swap(tx, o_0 - new_pt, execute)
-        else:
-            output_tx, pool_stat = super().swap(tx, out_amt, execute)
+            out_amt = self.__out_amount(tx, in_e, out_e)
+        output_tx, pool_stat = super().swap(tx, out_amt, execute)
         
         if execute:
-            self.equilibriums[pool] = [in_e, out_e, k]
-            self.equilibriums[(tx.outtype, tx.intype)] = [out_e, in_e, k]
-
-            o, _ = self.swap(tx, None, False)
+            # both orientations' rows are written in place through their views;
+            # k comes from the pool, which configure_simulation may have overridden
+            k = self.pools[tx.intype][tx.outtype][2]
+            forward, reverse = self.equilibriums[pool], self.equilibriums[(tx.outtype, tx.intype)]
+            forward[0], forward[1], forward[2] = in_e, out_e, k
+            reverse[0], reverse[1], reverse[2] = out_e, in_e, k
+
+            # rate the same swap would get from the balances it left behind
+            after_amt = self.__out_amount(tx, *self.calculate_equilibriums(tx.intype, tx.outtype))
             try:
-                output_tx.after_rate = tx.inval / \
-                    (o.outpool_init_val - o.outpool_after_val)
+                output_tx.after_rate = tx.inval / after_amt
             except ZeroDivisionError:
                 pass
         
@@ -123,24 +149,68 @@ class PMM(MarketMakerInterface):
         2. equilibrium balance for output token
         """
         firstIsLong = True
-        pool = (intype, outtype)
-        if self.token_info[pool][0] / self.equilibriums[pool][0] >= \
-            self.token_info[pool][1] / self.equilibriums[pool][1]:
-            l_b = self.token_info[pool][0]
-            s_b = self.token_info[pool][1]
-            l_e = self.equilibriums[pool][0]
-            p = self.prices[pool[1]] / self.prices[pool[0]]
+        pool_info = self.pools[intype][outtype]
+        in_b, out_b, k = pool_info[0], pool_info[1], pool_info[2]
+        equilibrium = self.equilibriums[(intype, outtype)]
+        in_e, out_e = equilibrium[0], equilibrium[1]
+        if in_b / in_e >= out_b / out_e:
+            l_b, s_b, l_e = in_b, out_b, in_e
+            p = self.market_rates[intype][outtype]
         else:
-            l_b = self.token_info[pool][1]
-            s_b = self.token_info[pool][0]
-            l_e = self.equilibriums[pool][1]
-            p = self.prices[pool[0]] / self.prices[pool[1]]
+            l_b, s_b, l_e = out_b, in_b, out_e
+            p = self.market_rates[outtype][intype]
             firstIsLong = False
 
-        k = self.token_info[pool][2]
-        s_e = s_b+s_b/(2*k)*((1+(4*k*(l_b-l_e))/(s_b*p))**0.5-1)
+        # a negative radicand keeps giving a complex root, as ** 0.5 did
+        u = 1+(4*k*(l_b-l_e))/(s_b*p)
+        s_e = s_b+s_b/(2*k)*((sqrt(u) if u >= 0 else u**0.5)-1)
 
         if firstIsLong:
             return l_e, s_e
         else:
             return s_e, l_e
+
+    def getRates(self, pools: List[Tuple[str, str]], cache: Dict = None
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns statistics about moving many token pairs to an equilibrium; if
+        any pool has no real and finite equilibrium, falls back to getRate for
+        every pool
+
+        Parameters:
+        1. pools: token pools, in order of intype and outtype
+        2. cache: only used when falling back to getRate
+
+        Returns:
+        1. amounts of intype token to input to reach equilibrium
+        2. amounts of outtype token to remove to reach equilibrium
+        3. ratios of internal exchange rate to market rate
+        """
+        index = self.token_info.index
+        rows = [index[pool] for pool in pools]
+        infos, equilibriums = self.token_info.array[rows], self.equilibriums.array[rows]
+        in_b, out_b, k = infos[:, 0], infos[:, 1], infos[:, 2]
+        in_e, out_e = equilibriums[:, 0], equilibriums[:, 1]
+        market_rates = np.array([self.market_rates[pool[0]][pool[1]] for pool in pools],
+            dtype=np.float64)
+        reverse_rates = np.array([self.market_rates[pool[1]][pool[0]] for pool in pools],
+            dtype=np.float64)
+
+        # same branches as calculate_equilibriums, taken per pool
+        with np.errstate(all="ignore"):
+            in_ratio, out_ratio = in_b / in_e, out_b / out_e
+            first_long = in_ratio >= out_ratio
+            l_b, s_b = np.where(first_long, in_b, out_b), np.where(first_long, out_b, in_b)
+            l_e = np.where(first_long, in_e, out_e)
+            p = np.where(first_long, market_rates, reverse_rates)
+            s_e = s_b+s_b/(2*k)*(np.sqrt(1+(4*k*(l_b-l_e))/(s_b*p))-1)
+
+        if not (np.isfinite(in_ratio).all() and np.isfinite(out_ratio).all() and
+            np.isfinite(s_e).all()):
+            # the scalar path raises the same errors as swapping would
+            return super().getRates(pools, cache)
+
+        in_amts = np.where(first_long, l_e, s_e) - in_b
+        out_amts = out_b - np.where(first_long, s_e, l_e)
+
+        return in_amts, out_amts, self.compareRates(market_rates, in_amts, out_amts)
@@ -1,8 +1,65 @@
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Hashable, Iterator
+from copy import deepcopy
+import numpy as np
 
-class PoolStatusInterface():
-    def __init__(self):
-        raise NotImplementedError
+class PoolStatusInterface(dict):
+    def __init__(self, keys: List[Hashable], infos: List[Tuple[float, ...]]):
+        """
+        Stores pool information contiguously, one row of floats per key; each
+        key maps to a view of its row, which reads and writes through to the
+        underlying array and returns plain floats
+
+        Parameters:
+        1. keys: token or token pool for each row
+        2. infos: token counts and k values for each row
+        """
+        self.index = {key: i for i, key in enumerate(keys)}
+        self.width = len(infos[0]) if len(infos) else 0
+        self.array = np.array(infos, dtype=np.float64).reshape(len(self.index), self.width)
+        self.flat = memoryview(self.array.reshape(-1))
+        dict.__init__(self, ((key, self.__missing__(key)) for key in self.index))
+
+    def __missing__(self, key: Hashable) -> memoryview:
+        # snapshots only create the row views that are actually read
+        if self.flat == None:
+            self.flat = memoryview(self.array.reshape(-1))
+        start = self.index[key] * self.width
+        row = self.flat[start : start + self.width]
+        dict.__setitem__(self, key, row)
+
+        return row
+
+    def __reduce__(self):
+        # the row views cannot be pickled, so the status is rebuilt from its
+        # index and array and the views are created again when read
+        return self.__class__.from_array, (self.index, self.array)
+
+    def __deepcopy__(self, memo: Dict) -> "PoolStatusInterface":
+        return self.from_array(deepcopy(self.index, memo), self.array.copy())
+
+    def __setitem__(self, key: Hashable, info: Tuple[float, ...]):
+        self.array[self.index[key]] = info
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.index
+
+    def __iter__(self) -> Iterator[Hashable]:
+        return iter(self.index)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def get(self, key: Hashable, default=None):
+        return self[key] if key in self.index else default
+
+    def keys(self):
+        return self.index.keys()
+
+    def values(self) -> List[memoryview]:
+        return [self[key] for key in self.index]
+
+    def items(self) -> List[Tuple[Hashable, memoryview]]:
+        return [(key, self[key]) for key in self.index]
 
     def pool_value(self, prices: Dict[str, float]) -> float:
         """
@@ -14,13 +71,52 @@ class PoolStatusInterface():
         Returns:
         1. Value of all tokens in pool
         """
-        value = 0
-        for tok in self.keys():
-            value += prices[tok]
-        
-        return value
+        raise NotImplementedError
+
+    @classmethod
+    def from_array(cls, index: Dict[Hashable, int], array: np.ndarray) -> "PoolStatusInterface":
+        """
+        Creates a pool status around an existing key index and array of rows;
+        row views are only created when read
+
+        Parameters:
+        1. index: maps each key to its row
+        2. array: one row of floats per key
+
+        Returns:
+        1. pool status backed by array
+        """
+        status = cls.__new__(cls)
+        dict.__init__(status)
+        status.index, status.width = index, array.shape[1]
+        status.array = array
+        status.flat = None
+
+        return status
+
+    def snapshot(self) -> "PoolStatusInterface":
+        """
+        Copies pool status; the key index is shared and only the array of
+        balances is copied
+
+        Returns:
+        1. copy of pool status
+        """
+        return self.from_array(self.index, self.array.copy())
+
+    def restore(self, pristine: "PoolStatusInterface", intype: str, outtype: str):
+        """
+        Resets the entries modified by a swap between 2 token types back to
+        their values in another pool status
+
+        Parameters:
+        1. pristine: pool status to restore from
+        2. intype: input token type
+        3. outtype: output token type
+        """
+        raise NotImplementedError
 
-class MultiTokenPoolStatus(PoolStatusInterface, dict):
+class MultiTokenPoolStatus(PoolStatusInterface):
     def __init__(self, status: Dict[str, Tuple[float, float]]):
         """
         Represents pool status for multi token liquidity pool market makers with
@@ -29,19 +125,85 @@ class MultiTokenPoolStatus(PoolStatusInterface, dict):
         Parameters:
         1. status: dictionary indicating tokens' counts and min k value
         """
-        dict.__init__(self, status)
+        super().__init__(list(status.keys()), list(status.values()))
 
+    def restore(self, pristine: "MultiTokenPoolStatus", intype: str, outtype: str):
+        """
+        Resets the entries modified by a swap between 2 token types back to
+        their values in another pool status
+
+        Parameters:
+        1. pristine: pool status to restore from
+        2. intype: input token type
+        3. outtype: output token type
+        """
+        rows = [self.index[intype], self.index[outtype]]
+        self.array[rows] = pristine.array[rows]
+
+    def pool_value(self, prices: Dict[str, float]) -> float:
+        """
+        Finds worth of al tokens in pool
 
-class PairwiseTokenPoolStatus(PoolStatusInterface, dict):
+        Parameters:
+        1. prices: maps tokens to prices
+
+        Returns:
+        1. Value of all tokens in pool
+        """
+        return float(np.dot(self.array[:, 0], [prices[tok] for tok in self.index]))
+
+
+class PairwiseTokenPoolStatus(PoolStatusInterface):
     def __init__(self, token_pairs: List[Tuple[str, str]],
     token_infos: List[Tuple[float, float, float]]):
         """
         Represents pool status for 2 token liquidity pool market makers
 
         Parameters:
-        1. token_pairs: tuples of trading pairs, i.e "['BTC. 'ETH']"; should not 
+        1. token_pairs: tuples of trading pairs, i.e "['BTC. 'ETH']"; should not
         have redundant pairs
         2. token_infos: token counts and k values for each trading pair
         """
-        for (tokenA, tokenB), (amountA, amountB, k) in zip(token_pairs, token_infos):
-            self[(tokenA, tokenB)] = [amountA, amountB, k]
+        super().__init__([(tokenA, tokenB) for tokenA, tokenB in token_pairs],
+            [(amountA, amountB, k) for amountA, amountB, k in token_infos])
+
+    def restore(self, pristine: "PairwiseTokenPoolStatus", intype: str, outtype: str):
+        """
+        Resets the entries modified by a swap between 2 token types back to
+        their values in another pool status
+
+        Parameters:
+        1. pristine: pool status to restore from
+        2. intype: input token type
+        3. outtype: output token type
+        """
+        rows = [self.index[(intype, outtype)], self.index[(outtype, intype)]]
+        self.array[rows] = pristine.array[rows]
+
+    def pool_value(self, prices: Dict[str, float]) -> float:
+        """
+        Finds worth of al tokens in pool; every pool is stored in both orders, so
+        the first balance of each row covers each token in each pool once
+
+        Parameters:
+        1. prices: maps tokens to prices
+
+        Returns:
+        1. Value of all tokens in pool
+        """
+        return float(np.dot(self.array[:, 0], [prices[pool[0]] for pool in self.index]))
+
+    def pool_index(self) -> Dict[str, Dict[str, memoryview]]:
+        """
+        Indexes pools by input token and then output token, which avoids building
+        and hashing a tuple on every lookup; entries are views into the pool
+        status, so they see every swap
+
+        Returns:
+        1. nested dictionary such that index[tokenA][tokenB] is self[(tokenA, tokenB)]
+        """
+        index = {}
+        for (tokenA, tokenB), info in self.items():
+            index.setdefault(tokenA, {})[tokenB] = info
+
+        return index
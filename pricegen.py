@@ -1,6 +1,4 @@
 from typing import List, Dict
-from copy import deepcopy
-import random
 import numpy as np
 
 class PriceGenerator():
@@ -45,35 +43,15 @@ class PriceGenerator():
         }
         """
         self.token_info = token_info
-    
-    def __get_new_price(self, token: str, old_price: float) -> float:
-        """
-        Generates new price for token
-
-        Parameters:
-        1. token: token type
-        2. old_price: token's old price
 
-        Returns:
-        1. new price for token type
-        """
-        mean = self.mean
-        stdv = self.stdv
-        probability = self.probabilities
-        info = self.token_info[token]
-        if "mean" in info:
-            mean = info["mean"]
-        if "stdv" in info:
-            stdv = info["stdv"]
-        if "change_probability" in info:
-            val = info["change_probability"]
-            probability = [1 - val, val]
-        
-        if random.choices([0,1], probability) == [1]:
-
-            return (1 + mean + np.random.normal(0, stdv)) * old_price
-        else:
-            return old_price
+        # per token parameters, with defaults filled in, for simulate_ext_prices
+        self.tokens = list(token_info)
+        infos = [token_info[tok] for tok in self.tokens]
+        self.starts = np.array([info["start"] for info in infos], dtype=np.float64)
+        self.means = np.array([info.get("mean", self.mean) for info in infos], dtype=np.float64)
+        self.stdvs = np.array([info.get("stdv", self.stdv) for info in infos], dtype=np.float64)
+        self.change_probabilities = np.array([info.get("change_probability",
+            self.probabilities[1]) for info in infos], dtype=np.float64)
     
     def simulate_ext_prices(self) -> List[Dict[str, float]]:
         """
@@ -82,13 +60,11 @@ class PriceGenerator():
         Returns:
         1. prices for each batch of swaps
         """
-        batch_price = {i : self.token_info[i]["start"] for i in self.token_info}
-        prices = [deepcopy(batch_price)]
-
-        for batch in range(self.batches - 1):
-            for tok in batch_price:
-                batch_price[tok] = self.__get_new_price(tok, batch_price[tok])
+        # every change between batches is drawn at once; a token's price is multiplied
+        # by 1 + mean + N(0, stdv) when it changes, and by 1 otherwise
+        shape = (max(self.batches - 1, 0), len(self.tokens))
+        changes = np.random.random_sample(shape) < self.change_probabilities
+        factors = np.where(changes, 1 + self.means + np.random.normal(0, 1, shape) * self.stdvs, 1)
+        prices = np.cumprod(np.vstack((self.starts, factors)), axis=0)
 
-            prices.append(deepcopy(batch_price))
-        
-        return prices
\ No newline at end of file
+        return [dict(zip(self.tokens, batch_price)) for batch_price in prices.tolist()]
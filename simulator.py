@@ -1,14 +1,13 @@
 import json
 import pickle
 import os
-import matplotlib.pyplot as plt
-import matplotlib.cm as cm
 import json
+import numpy as np
 import pandas as pd
-from typing import Tuple, Dict, List
-from copy import deepcopy
+from typing import Tuple, Dict, List, Union, TYPE_CHECKING
 from collections import OrderedDict
 from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
 import marketmakers
@@ -18,6 +17,9 @@ from pricegen import PriceGenerator
 from trafficgen import TrafficGenerator
 from inputtx import InputTx
 
+if TYPE_CHECKING:
+    from matplotlib.axes import Axes
+
 labels = {
     "cap_eff": ["% pool drained", "internal, external rate ratio"],
     "imp": ["swap number", "% token balance remaining"],
@@ -40,7 +42,31 @@ stat_groups = {
 data_formats = ["images", "stats", "raw_data"]
 metric_types = ["price_imp", "cap_eff", "imp"]
 
-def initialize_simulation(config: Dict, load_true_data: bool = False, load_true_txs: bool = False) -> Tuple[List[Tuple[str, str]], List[Tuple[float, float, float]],
+# most points plotted per series; more than this only redraws the same pixels
+MAX_PLOT_POINTS = 50000
+
+def __dump(obj, path: str):
+    """
+    Pickles obj to path; the data is written to a temporary file first and
+    moved into place, so path never holds a partially written object; the
+    temporary file is removed if writing fails
+
+    Parameters:
+    1. obj: object to pickle
+    2. path: destination file
+    """
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            pickle.dump(obj, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def initialize_simulation(config: Dict, run_dir: str, market: str,
+    load_true_data: bool = False, load_true_txs: bool = False) -> Tuple[List[Tuple[str, str]], List[Tuple[float, float, float]],
     List[str], List[Tuple[float, float]],
     Dict[str, Dict[str, float]], Dict[str, Dict[str, float]],
     List[str], float,
@@ -52,6 +78,10 @@ def initialize_simulation(config: Dict, load_true_data: bool = False, load_true_
 
     Parameters:
     1. config: JSON containing configuration
+    2. run_dir: output directory of the run
+    3. market: market type, names the generated price and traffic files
+    4. load_true_data: whether to use recorded prices instead of generating them
+    5. load_true_txs: whether to use recorded swaps instead of generating them
 
     Returns:
     1. list of pairwise token pools
@@ -81,7 +111,8 @@ def initialize_simulation(config: Dict, load_true_data: bool = False, load_true_
         price_generator = PriceGenerator(**config['price_gen']['init_kwargs'])
         price_generator.configure_tokens(price_gen_info)
 
-        ext_prices = price_generator.simulate_ext_prices()
+        # generated batches have no timestamps
+        ext_prices = [(None, batch_prices) for batch_prices in price_generator.simulate_ext_prices()]
     else:
         timestamps_to_info = OrderedDict()
         coins_df = pd.read_csv('true_data/coins.csv')
@@ -100,18 +131,15 @@ def initialize_simulation(config: Dict, load_true_data: bool = False, load_true_
         
         ext_prices: List[Tuple[datetime, Dict[str, float]]] = [(datetime.strptime(dt, '%Y-%m-%d %H:%M:%S'), infos) for dt, infos in timestamps_to_info.items()]
 
-    f = open(price_dir, "wb")
-    pickle.dump(list(timestamps_to_info.values()), f)
-    f.close()         
+    batch_prices = [infos for _, infos in ext_prices]
+    __dump(batch_prices, price_dir)
     
     traffic_dir = os.path.join(run_dir, market + "_traffic.obj")
     traffics = traffic_generator.generate_traffic(ext_prices, load_true_txs)
-    f = open(traffic_dir, "wb")
-    pickle.dump(traffics, f)
-    f.close()
+    __dump(traffics, traffic_dir)
     
     return pairwise_pools, pairwise_infos, single_pools, single_infos, traffic_info, price_gen_info, \
-    crash_types, cap_limit, list(timestamps_to_info.values()), traffics, price_dir, traffic_dir
+    crash_types, cap_limit, batch_prices, traffics, price_dir, traffic_dir
 
 def __pack_data(stat: str, raw: List, processed: List, monitors: Dict) -> Dict:
     """
@@ -121,7 +149,9 @@ def __pack_data(stat: str, raw: List, processed: List, monitors: Dict) -> Dict:
     1. stat: name of state (i.e. 'cap_eff')
     2. raw: list of raw data arrays
     3. processed: list of processed data arrays, with corresponding indices in raw
-    4. monitors: tokens or pools monitored
+    4. monitors: results for each token or pool monitored, as returned by metrics,
+    i.e. [raw first group, raw second group, processed first group, processed
+    second group, ...]
 
     Returns:
     1. dictionary mapping all information
@@ -129,19 +159,68 @@ def __pack_data(stat: str, raw: List, processed: List, monitors: Dict) -> Dict:
     dictionary =  {
         stat_groups[stat][i] : {"raw": raw[i], "processed": processed[i]} for i in range(len(raw))
     }
-    try:
-        dictionary["m"] = {
-            i : {"raw": raw[i], "processed": processed[i]} for i in monitors
-        }
-    except Exception as e:
-        import pdb; pdb.set_trace()
+    dictionary["m"] = {
+        monitor : {
+            stat_groups[stat][i] : {"raw": results[i], "processed": results[i + 2]} for i in range(2)
+        } for monitor, results in monitors.items()
+    }
     return dictionary
 
+def __scatter(ax: "Axes", groups: List[Union[np.ndarray, List[Tuple[float, float]]]], label: str):
+    """
+    Plots groups of points as one series with small circular markers, like
+    scatter(..., s=1) but through Line2D markers, which are much faster to
+    draw than a PathCollection; series larger than MAX_PLOT_POINTS are
+    subsampled
+
+    Parameters:
+    1. ax: axes to plot on
+    2. groups: (x, y) points, as arrays with one row per point or as lists
+    3. label: legend label for the points
+    """
+    points = np.concatenate([np.asarray(group, dtype=np.float64).reshape(-1, 2) for group in groups])
+    if len(points) > MAX_PLOT_POINTS:
+        # a fixed seed keeps images of the same data identical
+        keep = np.random.default_rng(0).choice(len(points), MAX_PLOT_POINTS, replace=False)
+        points = points[np.sort(keep)]
+    # markersize is a diameter in points and scatter's s an area in points^2, so
+    # markersize=1 matches s=1
+    ax.plot(points[:, 0], points[:, 1], "o", markersize=1, markeredgewidth=0, label=label)
+
+def __plot(series: List[Tuple[List, str]], stat: str, title: str, path: str):
+    """
+    Draws one figure of scatter series on a log y axis and saves it
+
+    Parameters:
+    1. series: (groups of points, legend label) for each series to plot
+    2. stat: name of stat (i.e. 'cap_eff'), selects the axis labels
+    3. title: figure title
+    4. path: where the image is saved
+    """
+    # matplotlib is only imported by runs that store images; figures are drawn
+    # without pyplot and only written to files, which Agg renders without any
+    # interactive backend
+    from matplotlib.figure import Figure
+
+    figure = Figure()
+    ax = figure.add_subplot()
+    for groups, label in series:
+        __scatter(ax, groups, label)
+    ax.set_title(title)
+    ax.set_xlabel(labels[stat][0])
+    ax.set_ylabel(labels[stat][1])
+    ax.set_yscale("log")
+    ax.legend(loc='best')
+    figure.tight_layout()
+    figure.savefig(path, bbox_inches='tight')
+
 def simulate(config: Dict, 
     pairwise_pools: List[Tuple[str, str]], pairwise_infos: List[Tuple[float, float, float]],
     single_pools: List[str], single_infos: List[Tuple[float, float]],
     crash_types: List[str],
-    traffics: List[List[InputTx]], ext_prices: List[Dict[str, float]]
+    traffics: List[List[InputTx]], ext_prices: List[Dict[str, float]],
+    run_dir: str, run_count: int, market: str, mm_name: str,
+    save_images: bool, save_data: bool
     ) -> None:
     """
     Performs simulation given a market type and market maker
@@ -155,12 +234,12 @@ def simulate(config: Dict,
     6. crash_types: token types that are crashing
     7. traffics: batches of InputTx for simulation
     8. ext_prices: prices of tokens for every batch
-    9. multi_monitors: tokens to monitor in multi-token setting
-    10. pairwise_monitors: pools to monitor in pairwise-pool setting
-
-    Returns:
-    1. path to generated prices
-    2. path to generated traffic
+    9. run_dir: output directory of the run
+    10. run_count: number of the run
+    11. market: market type
+    12. mm_name: name of the market maker config
+    13. save_images: whether to store images
+    14. save_data: whether to store raw data
     """
     MMClass = getattr(marketmakers, config['type'])
     mm = MMClass(pairwise_pools, pairwise_infos, single_pools, single_infos)
@@ -278,120 +357,60 @@ def simulate(config: Dict,
     market_name, pretty_mm_name = pretty_market[market], mm_name.replace("_0", " k=0.")
 
     # write stats
-    with open("{}/stats/{}/{}.json".format(run_dir, market, mm_name), "w") as f:
+    with open(os.path.join(run_dir, "stats", market, mm_name + ".json"), "w") as f:
         f.write(all_info_str)
     
     if save_images:
+        image_dir = os.path.join(run_dir, "images", market)
         # price_impact
-        combined = pos_pri + neg_pri
-        plt.scatter([x[0] for x in combined], [x[1] for x in combined], s=1, label="all tokens")
-        for i in pri_monitor:
-            combined = pri_monitor[i][0] + pri_monitor[i][1]
-            plt.scatter([x[0] for x in combined], [x[1] for x in combined], s=1, label=i)
-        plt.title("run {}, {} price impact: {}".format(run_count, market_name, pretty_mm_name))
-        plt.xlabel(labels["price_imp"][0])
-        plt.ylabel(labels["price_imp"][1])
-        plt.yscale("log")
-        plt.legend(loc='best')
-        plt.tight_layout()
-        plt.savefig('{}/images/{}/price_imp/{}.png'.format(run_dir, market, mm_name), bbox_inches='tight')
-        plt.clf()
-        
-        combined = proc_pos_pri + proc_neg_pri
-        plt.scatter([x[0] for x in combined], [x[1] for x in combined], s=1, label="all tokens")
-        for i in pri_monitor:
-            combined = pri_monitor[i][2] + pri_monitor[i][3]
-            plt.scatter([x[0] for x in combined], [x[1] for x in combined], s=1, label=i)
-        plt.title("run {}, {} processed price impact: {}".format(run_count, market_name, pretty_mm_name))
-        plt.xlabel(labels["price_imp"][0])
-        plt.ylabel(labels["price_imp"][1])
-        plt.yscale("log")
-        plt.legend(loc='best')
-        plt.tight_layout()
-        plt.savefig('{}/images/{}/price_imp/proc_{}.png'.format(run_dir, market, mm_name), bbox_inches='tight')
-        plt.clf()
+        __plot([([pos_pri, neg_pri], "all tokens")] +
+            [([pri_monitor[i][0], pri_monitor[i][1]], i) for i in pri_monitor],
+            "price_imp", "run {}, {} price impact: {}".format(run_count, market_name, pretty_mm_name),
+            os.path.join(image_dir, "price_imp", mm_name + ".png"))
+        __plot([([proc_pos_pri, proc_neg_pri], "all tokens")] +
+            [([pri_monitor[i][2], pri_monitor[i][3]], i) for i in pri_monitor],
+            "price_imp", "run {}, {} processed price impact: {}".format(run_count, market_name, pretty_mm_name),
+            os.path.join(image_dir, "price_imp", "proc_" + mm_name + ".png"))
         
         # capital efficiency
-        combined = pos_cap + neg_cap
-        plt.scatter([x[0] for x in combined], [x[1] for x in combined], s=1, label="all tokens")
-        for i in cap_monitor:
-            combined = cap_monitor[i][0] + cap_monitor[i][1]
-            plt.scatter([x[0] for x in combined], [x[1] for x in combined], s=1, label=i)
-        plt.title("run {}, {} capital efficiency: {}".format(run_count, market_name, pretty_mm_name))
-        plt.xlabel(labels["cap_eff"][0])
-        plt.ylabel(labels["cap_eff"][1])
-        plt.yscale("log")
-        plt.legend(loc='best')
-        plt.tight_layout()
-        plt.savefig('{}/images/{}/cap_eff/{}.png'.format(run_dir, market, mm_name), bbox_inches='tight')
-        plt.clf()
-        
-        combined = proc_pos_cap + proc_neg_cap
-        plt.scatter([x[0] for x in combined], [x[1] for x in combined], s=1, label="all tokens")
-        for i in cap_monitor:
-            combined = cap_monitor[i][2] + cap_monitor[i][3]
-            plt.scatter([x[0] for x in combined], [x[1] for x in combined], s=1, label=i)
-        plt.title("run {}, {} processed capital efficiency: {}".format(run_count, market_name, pretty_mm_name))
-        plt.xlabel(labels["cap_eff"][0])
-        plt.ylabel(labels["cap_eff"][1])
-        plt.yscale("log")
-        plt.legend(loc='best')
-        plt.tight_layout()
-        plt.savefig('{}/images/{}/cap_eff/proc_{}.png'.format(run_dir, market, mm_name), bbox_inches='tight')
-        plt.clf()
+        __plot([([pos_cap, neg_cap], "all tokens")] +
+            [([cap_monitor[i][0], cap_monitor[i][1]], i) for i in cap_monitor],
+            "cap_eff", "run {}, {} capital efficiency: {}".format(run_count, market_name, pretty_mm_name),
+            os.path.join(image_dir, "cap_eff", mm_name + ".png"))
+        __plot([([proc_pos_cap, proc_neg_cap], "all tokens")] +
+            [([cap_monitor[i][2], cap_monitor[i][3]], i) for i in cap_monitor],
+            "cap_eff", "run {}, {} processed capital efficiency: {}".format(run_count, market_name, pretty_mm_name),
+            os.path.join(image_dir, "cap_eff", "proc_" + mm_name + ".png"))
         
         # impermanent loss
-        combined = imp_gain + imp_loss
-        plt.scatter([x[0] for x in combined], [x[1] for x in combined], s=1, label="all tokens")
-        plt.scatter([x[0] for x in imp_avg], [x[1] for x in imp_avg], s=1, label="all token averages")
-        plt.scatter([x[0] for x in imp_med], [x[1] for x in imp_med], s=1, label="all token median")
-        for i in imp_monitor:
-            combined = imp_monitor[i][0] + imp_monitor[i][1]
-            plt.scatter([x[0] for x in combined], [x[1] for x in combined], s=1, label=i)
-        plt.title("run {}, {} impermanent loss, gain: {}".format(run_count, market_name, pretty_mm_name))
-        plt.xlabel(labels["imp"][0])
-        plt.ylabel(labels["imp"][1])
-        plt.yscale("log")
-        plt.legend(loc='best')
-        plt.tight_layout()
-        plt.savefig('{}/images/{}/imp/{}.png'.format(run_dir, market, mm_name), bbox_inches='tight')
-        plt.clf()
-        
-        combined = proc_imp_gain + proc_imp_loss
-        plt.scatter([x[0] for x in combined], [x[1] for x in combined], s=1, label="all tokens")
-        plt.scatter([x[0] for x in proc_imp_avg], [x[1] for x in proc_imp_avg], s=1, label="all token averages")
-        plt.scatter([x[0] for x in proc_imp_med], [x[1] for x in proc_imp_med], s=1, label="all token median")
-        for i in imp_monitor:
-            combined = imp_monitor[i][2] + imp_monitor[i][3]
-            plt.scatter([x[0] for x in combined], [x[1] for x in combined], s=1, label=i)
-        plt.title("run {}, {} impermanent loss, gain: {}".format(run_count, market_name, pretty_mm_name))
-        plt.xlabel(labels["imp"][0])
-        plt.ylabel(labels["imp"][1])
-        plt.yscale("log")
-        plt.legend(loc='best')
-        plt.tight_layout()
-        plt.savefig('{}/images/{}/imp/proc_{}.png'.format(run_dir, market, mm_name), bbox_inches='tight')
-        plt.clf()
+        __plot([([imp_gain, imp_loss], "all tokens"), ([imp_avg], "all token averages"), ([imp_med], "all token median")] +
+            [([imp_monitor[i][0], imp_monitor[i][1]], i) for i in imp_monitor],
+            "imp", "run {}, {} impermanent loss, gain: {}".format(run_count, market_name, pretty_mm_name),
+            os.path.join(image_dir, "imp", mm_name + ".png"))
+        __plot([([proc_imp_gain, proc_imp_loss], "all tokens"), ([proc_imp_avg], "all token averages"),
+            ([proc_imp_med], "all token median")] +
+            [([imp_monitor[i][2], imp_monitor[i][3]], i) for i in imp_monitor],
+            "imp", "run {}, {} impermanent loss, gain: {}".format(run_count, market_name, pretty_mm_name),
+            os.path.join(image_dir, "imp", "proc_" + mm_name + ".png"))
 
     if save_data:
         cap_eff_data = __pack_data('cap_eff', [pos_cap, neg_cap], [proc_pos_cap, proc_neg_cap], cap_monitor)
-        pri_data = __pack_data('price_imp', [pos_pri, neg_pri], [proc_pos_pri_dict, proc_neg_pri_dict], pri_monitor)
+        pri_data = __pack_data('price_imp', [pos_pri, neg_pri], [proc_pos_pri, proc_neg_pri], pri_monitor)
         imp_data = __pack_data('imp',
                 [imp_gain, imp_loss, imp_avg, imp_med],
                 [proc_imp_gain, proc_imp_loss, proc_imp_avg, proc_imp_med],
                 imp_monitor)
 
+        raw_dir = os.path.join(run_dir, "raw_data", market)
+
         # price_impact
-        pickle.dump(pri_data, \
-            open("{}/raw_data/{}/price_imp/{}.pkl".format(run_dir, market, mm_name), "wb"))
+        __dump(pri_data, os.path.join(raw_dir, "price_imp", mm_name + ".pkl"))
         
         # capital efficiency
-        pickle.dump(cap_eff_data, \
-            open("{}/raw_data/{}/cap_eff/{}.pkl".format(run_dir, market, mm_name), "wb"))
+        __dump(cap_eff_data, os.path.join(raw_dir, "cap_eff", mm_name + ".pkl"))
         
         # impermanent loss
-        pickle.dump(imp_data, \
-            open("{}/raw_data/{}/imp/{}.pkl".format(run_dir, market, mm_name), "wb"))
+        __dump(imp_data, os.path.join(raw_dir, "imp", mm_name + ".pkl"))
 
 def yes_no(query: str) -> bool:
     """
@@ -438,64 +457,58 @@ if __name__ == '__main__':
     save_data = yes_no("store raw data? (Y/N): ")
     save_generated = yes_no("save generated price and traffic objects? (Y/N): ")
     
-    if not os.path.exists(base_dir):
-        os.mkdir(base_dir)
-    
+    # every output directory is known up front, so they are all created before
+    # any simulation starts; makedirs creates the parents along the way
+    markets = [market for market in os.listdir(args.configs_path) if not "json" in market]
+    mm_configs = {}
+    for mm in os.listdir(args.configs_path):
+        if "json" in mm:
+            with open(os.path.join(args.configs_path, mm), 'r') as f:
+                mm_configs[mm[:-5]] = json.load(f)
+    formats = [dir for dir in data_formats if (dir == "stats") or (dir == "images" and save_images)
+        or (dir == "raw_data" and save_data)]
     for run_count in range(int(runs)):
         run_dir = os.path.join(base_dir, "run_" + str(run_count))
-        if not os.path.exists(run_dir):
-            os.mkdir(run_dir)
-
-        stat_dir_dict = {}
-        for dir in data_formats:
-            if (dir == "stats") or (dir == "images" and save_images) or (dir == "raw_data" and save_data):
-                combined_dir = os.path.join(run_dir, dir)
-                if not os.path.exists(combined_dir):
-                    os.mkdir(combined_dir)
-                
-                if dir != "stats":
-                    for market in os.listdir(args.configs_path):
-                        if not "json" in market:
-                            market_dir = os.path.join(combined_dir, market)
-                            if not os.path.exists(market_dir):
-                                os.mkdir(market_dir)
-
-                            for stat in metric_types:
-                                stat_dir = os.path.join(market_dir, stat)
-                                if not os.path.exists(stat_dir):
-                                    os.mkdir(stat_dir)
-
+        for dir in formats:
+            for market in markets:
+                market_dir = os.path.join(run_dir, dir, market)
+                if dir == "stats":
+                    os.makedirs(market_dir, exist_ok=True)
                 else:
-                    for market in os.listdir(args.configs_path):
-                        if not "json" in market:
-                            market_dir = os.path.join(combined_dir, market)
-                            if not os.path.exists(market_dir):
-                                stat_dir_dict[market] = market_dir
-                                os.mkdir(market_dir)         
-        
-        for market in os.listdir(args.configs_path):
-            if not "json" in market:
+                    for stat in metric_types:
+                        os.makedirs(os.path.join(market_dir, stat), exist_ok=True)
+    
+    # market makers of every market and run are simulated independently in
+    # separate processes; each task is pickled, so every worker gets its own copy
+    # of the inputs
+    with ProcessPoolExecutor() as executor:
+        futures, generated = [], []
+        for run_count in range(int(runs)):
+            run_dir = os.path.join(base_dir, "run_" + str(run_count))
+            for market in markets:
                 market_path = os.path.join(args.configs_path, market)
                 with open(os.path.join(market_path, "init.json"), 'r') as f:
                     config = json.load(f)
                 pairwise_pools, pairwise_infos, single_pools, single_infos, traffic_info, \
                 price_gen_info, crash_types, cap_limit, ext_prices, traffics, \
-                price_dir, traffic_dir = initialize_simulation(config, args.existing_prices, args.existing_txs)
-               
-                for mm in os.listdir(args.configs_path):
-                    if "json" in mm:
-                        mm_name = mm[:-5]
-                        with open(os.path.join(args.configs_path, mm), 'r') as f:
-                            config = json.load(f)
-
-                        simulate(
-                            config,
-                            deepcopy(pairwise_pools), deepcopy(pairwise_infos),
-                            deepcopy(single_pools), deepcopy(single_infos),
-                            crash_types,
-                            deepcopy(traffics), ext_prices
-                        )
-            
-                if not save_generated:
-                    os.remove(price_dir)
-                    os.remove(traffic_dir)
\ No newline at end of file
+                price_dir, traffic_dir = initialize_simulation(config, run_dir, market,
+                    args.existing_prices, args.existing_txs)
+                generated += [price_dir, traffic_dir]
+
+                for mm_name, mm_config in mm_configs.items():
+                    futures.append(executor.submit(simulate,
+                        mm_config,
+                        pairwise_pools, pairwise_infos,
+                        single_pools, single_infos,
+                        crash_types,
+                        traffics, ext_prices,
+                        run_dir, run_count, market, mm_name, save_images, save_data
+                    ))
+
+        # surfaces the first error raised by a simulation
+        for future in futures:
+            future.result()
+
+    if not save_generated:
+        for path in generated:
+            os.remove(path)
\ No newline at end of file
@@ -0,0 +1,40 @@
+from inputtx import InputTx
+from marketmakers import MAMM
+
+TOKENS = ["BTC", "ETH", "USDT"]
+PRICES = {"BTC": 30000.0, "ETH": 2000.0, "USDT": 1.0}
+
+def make_mamm() -> MAMM:
+    mm = MAMM([], [], list(TOKENS), [[100.0, 0.5], [1500.0, 0.5], [3e6, 0.5]])
+    mm.configure_simulation(multi_token="True")
+    mm.set_prices(PRICES)
+
+    return mm
+
+def make_txs():
+    return [InputTx("BTC", "ETH", 1.5), InputTx("ETH", "USDT", 40.0), InputTx("USDT", "BTC", 0.0),
+        InputTx("USDT", "BTC", 25000.0), InputTx("ETH", "BTC", 12.0)]
+
+def fields(output):
+    return [getattr(output, name) for name in output.__slots__]
+
+def check_batch_matches_swaps(pristine: bool):
+    batch_mm, swap_mm = make_mamm(), make_mamm()
+    batch_pristine = batch_mm.token_info.snapshot() if pristine else None
+    swap_pristine = swap_mm.token_info.snapshot()
+
+    outputs, statuses = batch_mm.swap_batch(make_txs(), batch_pristine)
+    for tx, output, status in zip(make_txs(), outputs, statuses):
+        expected, expected_status = swap_mm.swap(tx)
+        assert fields(output) == fields(expected)
+        assert status.array.tolist() == expected_status.array.tolist()
+        if pristine:
+            swap_mm.token_info.restore(swap_pristine, tx.intype, tx.outtype)
+
+    assert batch_mm.token_info.array.tolist() == swap_mm.token_info.array.tolist()
+
+def test_swap_batch_matches_swap():
+    check_batch_matches_swaps(False)
+
+def test_swap_batch_matches_swap_with_reset():
+    check_batch_matches_swaps(True)
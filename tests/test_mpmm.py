@@ -0,0 +1,65 @@
+import random
+from math import sqrt, hypot, cos, atan2, nan
+
+from marketmakers import MPMM
+
+MM = MPMM([], [], [], [])
+get_equilibrium, cubic_terms = MM._MPMM__getEquilibrium, MM._MPMM__cubicTerms
+
+# equilibrium inputs (s, l, k, p, S, L) where the shortage equilibrium nearly
+# cancels to 0, so its relative error is unbounded
+NEAR_DEGENERATE = [
+    (1.3888921234492484, 6.995930880626007, 0.25, 0.155741865093704, 374.8017409125008, 12.583423910751554),
+    (7.706361062876322, 56754.203071062846, 0.25, 79.00348503503274, 7280.550874289335, 78803.94803091898),
+    (0.02133110369678647, 12.431671571398375, 0.25, 4.834906897011779, 20.807271810228485, 26.974152307322175),
+]
+
+def divided_equilibrium(s, l, k, p, S, L):
+    """
+    The closed form root as written before its divisions were folded into
+    reciprocals
+    """
+    x1, x3, x4, t35 = cubic_terms(s, l, k, p, S, L)
+    disc = x3*x3+4*x4*x4*x4
+    if disc >= 0:
+        v = x3+sqrt(disc)
+        x5, scale = (v**(1/3), 1) if v >= 0 else ((-v)**(1/3), 0.5)
+    else:
+        im = sqrt(-disc)
+        x5, scale = hypot(x3, im)**(1/3), cos(atan2(im, x3)/3)
+    l_e = x1/(12*t35)+scale*(x4/(24*2**(2/3)*t35*x5)-(1/(48*2**(1/3)*t35))*x5)
+    u = 1 + (4*k * (l - l_e)) / (s * p)
+    if not u >= 0:
+        return nan, l_e
+
+    return s + s / (2*k) * (sqrt(u) - 1), l_e
+
+def random_inputs(count: int):
+    rng = random.Random(0)
+    for _ in range(count):
+        S, L = 10**rng.uniform(0, 6), 10**rng.uniform(0, 6)
+        yield (S*10**rng.uniform(-3, 0.5), L*10**rng.uniform(-0.5, 3), rng.choice([0.05, 0.25, 0.5, 0.75]),
+            L/S*10**rng.uniform(-1, 1), S, L)
+
+def check_close(inputs):
+    s_e, l_e = get_equilibrium(*inputs)
+    expected_s_e, expected_l_e = divided_equilibrium(*inputs)
+    assert abs(l_e - expected_l_e) <= 1e-12 * abs(expected_l_e)
+    if expected_s_e == expected_s_e:
+        # s_e = s + s/(2k)*(sqrt(u)-1) loses its relative accuracy as it cancels
+        # towards 0, so it is only held to the scale of the shortage balance
+        assert abs(s_e - expected_s_e) <= 1e-12 * inputs[0]
+    else:
+        assert s_e != s_e
+
+def test_equilibrium_matches_divided_form():
+    for inputs in random_inputs(2000):
+        try:
+            get_equilibrium(*inputs), divided_equilibrium(*inputs)
+        except (OverflowError, ZeroDivisionError):
+            continue
+        check_close(inputs)
+
+def test_equilibrium_near_degenerate():
+    for inputs in NEAR_DEGENERATE:
+        check_close(inputs)
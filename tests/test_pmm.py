@@ -0,0 +1,55 @@
+import pytest
+
+from inputtx import InputTx
+from marketmakers import PMM
+
+PRICES = {"BTC": 30000.0, "ETH": 2000.0}
+
+def make_pmm() -> PMM:
+    mm = PMM([["BTC", "ETH"], ["ETH", "BTC"]], [[100.0, 1500.0, 0.5], [1500.0, 100.0, 0.5]])
+    mm.configure_simulation(multi_token="False")
+    mm.set_prices(PRICES)
+
+    return mm
+
+def divided_out_amount(mm: PMM, tx: InputTx, in_e: float, out_e: float) -> float:
+    """
+    __out_amount with its short token chosen by the original division form
+    """
+    i_0, o_0, k = mm.pools[tx.intype][tx.outtype][:3]
+    d = tx.inval
+    p = mm.market_rates[tx.intype][tx.outtype]
+
+    if o_0 / out_e > i_0 / in_e:
+        static_amt = in_e - i_0
+        if static_amt < d:
+            new_pt = mm._PMM__solveShort(d - static_amt + in_e, in_e, out_e, p, k)
+        else:
+            new_pt = mm._PMM__solveLong(i_0 + d, out_e, in_e, 1/p, k)
+    else:
+        new_pt = mm._PMM__solveShort(i_0 + d, in_e, out_e, p, k)
+
+    return o_0 - new_pt
+
+@pytest.mark.parametrize("in_e, out_e", [(0.0, 1500.0), (100.0, 0.0), (0.0, 0.0), (-0.0, 1500.0)])
+def test_out_amount_rejects_zero_equilibrium(in_e, out_e):
+    mm = make_pmm()
+    with pytest.raises(ZeroDivisionError):
+        mm._PMM__out_amount(InputTx("BTC", "ETH", 1.0), in_e, out_e)
+
+@pytest.mark.parametrize("in_e, out_e", [
+    (-5.0, 1500.0), (100.0, -20.0), (-5.0, -20.0), (-150.0, 1500.0), (100.0, -3000.0), (120.0, 1400.0)
+])
+def test_out_amount_matches_division_form(in_e, out_e):
+    mm = make_pmm()
+    tx = InputTx("BTC", "ETH", 1.0)
+    assert mm._PMM__out_amount(tx, in_e, out_e) == divided_out_amount(mm, tx, in_e, out_e)
+
+def test_swap_writes_equilibrium_k():
+    mm = make_pmm()
+    mm.configure_simulation(multi_token="False", k=0.25)
+    mm.set_prices(PRICES)
+    mm.swap(InputTx("BTC", "ETH", 1.0))
+
+    assert mm.equilibriums[("BTC", "ETH")][2] == 0.25
+    assert mm.equilibriums[("ETH", "BTC")][2] == 0.25
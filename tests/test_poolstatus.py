@@ -0,0 +1,36 @@
+import copy
+import pickle
+
+from poolstatus import MultiTokenPoolStatus, PairwiseTokenPoolStatus
+
+def make_statuses():
+    multi = MultiTokenPoolStatus({"BTC": (100.0, 0.5), "ETH": (1500.0, 0.5)})
+    pairwise = PairwiseTokenPoolStatus([["BTC", "ETH"], ["ETH", "BTC"]],
+        [[100.0, 1500.0, 0.5], [1500.0, 100.0, 0.5]])
+
+    return [multi, pairwise, multi.snapshot(), pairwise.snapshot()]
+
+def check_copy(original, duplicate):
+    assert type(duplicate) == type(original)
+    assert list(duplicate.keys()) == list(original.keys())
+    assert [list(row) for row in duplicate.values()] == [list(row) for row in original.values()]
+
+    # the copy has its own balances
+    key = next(iter(original))
+    duplicate[key] = [0.0] * original.width
+    assert list(original[key]) != list(duplicate[key])
+
+def test_status_pickles():
+    for status in make_statuses():
+        check_copy(status, pickle.loads(pickle.dumps(status, pickle.HIGHEST_PROTOCOL)))
+
+def test_status_deepcopies():
+    for status in make_statuses():
+        check_copy(status, copy.deepcopy(status))
+
+def test_get_reads_rows():
+    for status in make_statuses():
+        key = next(iter(status))
+        assert list(status.get(key)) == list(status[key])
+        assert status.get("missing") == None
+        assert status.get("missing", 0) == 0
@@ -0,0 +1,95 @@
+import json
+import os
+import pickle
+import random
+
+import numpy as np
+import pytest
+
+import simulator
+from inputtx import InputTx
+
+TOKENS = ["BTC", "ETH", "USDT"]
+BALANCES = {"BTC": 100.0, "ETH": 1500.0, "USDT": 3e6}
+PRICES = {"BTC": 30000.0, "ETH": 2000.0, "USDT": 1.0}
+
+def make_inputs():
+    rng = random.Random(0)
+    pairwise_pools, pairwise_infos = [], []
+    for i, tokA in enumerate(TOKENS):
+        for tokB in TOKENS[i + 1:]:
+            pairwise_pools += [[tokA, tokB], [tokB, tokA]]
+            pairwise_infos += [[BALANCES[tokA] / 2, BALANCES[tokB] / 2, 0.5],
+                [BALANCES[tokB] / 2, BALANCES[tokA] / 2, 0.5]]
+    single_infos = [[BALANCES[tok], 0.5] for tok in TOKENS]
+
+    traffics, ext_prices, prices = [], [], dict(PRICES)
+    for _ in range(4):
+        batch = []
+        for _ in range(6):
+            intype, outtype = rng.sample(TOKENS, 2)
+            batch.append(InputTx(intype, outtype, BALANCES[intype] * rng.uniform(0.001, 0.01)))
+        traffics.append(batch)
+        ext_prices.append(dict(prices))
+        prices = {tok: price * rng.uniform(0.99, 1.01) for tok, price in prices.items()}
+
+    return pairwise_pools, pairwise_infos, list(TOKENS), single_infos, traffics, ext_prices
+
+@pytest.mark.parametrize("mm_name", ["mamm", "amm"])
+def test_simulate_saves_raw_data(tmp_path, mm_name):
+    with open(os.path.join(os.path.dirname(__file__), "..", "config", mm_name + ".json")) as f:
+        config = json.load(f)
+    run_dir, market = str(tmp_path), "random"
+    os.makedirs(os.path.join(run_dir, "stats", market))
+    for stat in simulator.metric_types:
+        os.makedirs(os.path.join(run_dir, "raw_data", market, stat))
+
+    pairwise_pools, pairwise_infos, single_pools, single_infos, traffics, ext_prices = make_inputs()
+    simulator.simulate(config, pairwise_pools, pairwise_infos, single_pools, single_infos, [],
+        traffics, ext_prices, run_dir, 0, market, mm_name, False, True)
+
+    monitor = "BTC" if mm_name == "mamm" else "BTC, ETH"
+    for stat in simulator.metric_types:
+        with open(os.path.join(run_dir, "raw_data", market, stat, mm_name + ".pkl"), "rb") as f:
+            data = pickle.load(f)
+        groups = simulator.stat_groups[stat]
+        assert set(data) == set(groups) | {"m"}
+        assert set(data["m"]) == {monitor}
+        assert set(data["m"][monitor]) == set(groups[:2])
+        for group in groups[:2]:
+            monitored = data["m"][monitor][group]
+            # a monitor only sees some of the swaps, each measured like the rest
+            assert len(monitored["raw"]) <= len(data[group]["raw"])
+            assert len(monitored["processed"]) <= len(monitored["raw"])
+            for row in np.asarray(monitored["raw"]).reshape(-1, 2).tolist():
+                assert row in np.asarray(data[group]["raw"]).tolist()
+
+def test_dump_removes_temporary_file_on_failure(tmp_path):
+    path = str(tmp_path / "data.pkl")
+    with pytest.raises(Exception):
+        getattr(simulator, "__dump")(lambda: None, path)
+
+    assert os.listdir(tmp_path) == []
+
+def test_initialize_simulation_generates_prices(tmp_path, monkeypatch):
+    repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    monkeypatch.chdir(repo_dir)
+    with open(os.path.join("config", "random", "init.json")) as f:
+        config = json.load(f)
+    config["traffic"]["init_kwargs"]["shape"] = [3, 4]
+    config["price_gen"]["init_kwargs"]["batches"] = 3
+    # the generated traffic swaps every token in true_data, so each needs a price
+    tokens = [name[: name.index("-")].upper() for name in os.listdir("true_data/daily_volumes")]
+    price_infos = {token: {"start": 1.0} for token in tokens}
+    config["initializer"]["token_configs"]["token_infos"]["price_gen"] = price_infos
+
+    outputs = simulator.initialize_simulation(config, str(tmp_path), "random")
+    ext_prices, traffics, price_dir, traffic_dir = outputs[-4:]
+
+    assert len(ext_prices) == 3 and len(traffics) == 3
+    assert [set(prices) for prices in ext_prices] == [set(tokens)] * 3
+    with open(price_dir, "rb") as f:
+        assert pickle.load(f) == ext_prices
+    with open(traffic_dir, "rb") as f:
+        assert len(pickle.load(f)) == 3
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]